@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+# MIT License
+
+# Copyright (c) 2019 Björn Larsson
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Measures the time and peak memory of each conversion stage on synthetic calendars
+
+    python -m benchmarks.bench --events 5000 --save baseline.json
+    python -m benchmarks.bench --events 5000 --compare baseline.json
+
+Timings are the best of --repeat runs, peak memory is measured in a separate run under tracemalloc
+so that tracing does not distort the timings. The calendars are read from a temporary file, like the
+tool reads its input, and rendered to os.devnull, so that the peak memory is the converter's own.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.calendars import generate_calendar
+from ical2org.ical2org import Calendar, StreamingCalendar, _index_series
+from ical2org.version import version
+
+WORKLOADS = {
+    'simple': dict(all_day=0.2, recurring=0.0, exdates=0.0, overrides=0.0),
+    'mixed': dict(all_day=0.15, recurring=0.3, exdates=0.2, overrides=0.1),
+    'recurring': dict(all_day=0.05, recurring=0.9, exdates=1.0, overrides=0.5),
+    'outlook': dict(all_day=0.1, recurring=0.3, exdates=0.2, overrides=0.1, attachments=0.5),
+}
+
+
+def _stages(path):
+    """Returns the (name, setup, run) stages measured for a calendar file, setup results are passed to run"""
+    def _opened():
+        return open(path, 'rb')
+
+    def _parsed():
+        with _opened() as stream:
+            return Calendar(stream)
+
+    def _init(stream):
+        with stream:
+            Calendar(stream)
+
+    def _stream(stream):
+        with stream, open(os.devnull, 'w', encoding='utf8') as out:
+            StreamingCalendar(stream).write(out)
+
+    return [('init', _opened, _init),
+            ('group', _parsed, lambda calendar: _index_series(calendar._events)),
+            ('get_events', _parsed, lambda calendar: calendar._get_events()),
+            ('str', _parsed, lambda calendar: str(calendar)),
+            ('stream', _opened, _stream)]
+
+
+def _measure(setup, run, repeat):
+    best = None
+    for _ in range(repeat):
+        state = setup()
+        started = time.perf_counter()
+        run(state)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+
+    state = setup()
+    tracemalloc.start()
+    try:
+        run(state)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return dict(seconds=best, peak_bytes=peak)
+
+
+def run_benchmarks(events, seed=0, repeat=3, workloads=None):
+    """Returns the benchmark results for the given workloads as a JSON serializable dict"""
+    results = dict(version=version(), python=sys.version.split()[0], events=events, seed=seed, workloads=dict())
+
+    for name in workloads or sorted(WORKLOADS):
+        data = generate_calendar(events=events, seed=seed, **WORKLOADS[name]).encode('utf8')
+        fd, path = tempfile.mkstemp(suffix='.ics')
+        try:
+            with os.fdopen(fd, 'wb') as stream:
+                stream.write(data)
+
+            stages = dict()
+            for stage, setup, run in _stages(path):
+                stages[stage] = _measure(setup, run, repeat)
+        finally:
+            os.unlink(path)
+        results['workloads'][name] = dict(input_bytes=len(data), stages=stages)
+
+    return results
+
+
+def _report(results, baseline=None, out=sys.stdout):
+    out.write("ical2org-two {version}, python {python}, {events} events, seed {seed}\n".format(**results))
+    if baseline:
+        out.write("compared to {version}, python {python}, {events} events, seed {seed}\n".format(**baseline))
+
+    for workload, data in sorted(results['workloads'].items()):
+        out.write("\n{} ({:.1f} MB input)\n".format(workload, data['input_bytes'] / 1e6))
+        for stage, measured in sorted(data['stages'].items()):
+            line = "  {:<12} {:>9.3f} s {:>9.1f} MB".format(stage, measured['seconds'], measured['peak_bytes'] / 1e6)
+            try:
+                previous = baseline['workloads'][workload]['stages'][stage]
+                line += "  {:+6.1f}% time {:+6.1f}% memory".format(
+                    100.0 * (measured['seconds'] / previous['seconds'] - 1),
+                    100.0 * (measured['peak_bytes'] / float(previous['peak_bytes']) - 1))
+            except (KeyError, TypeError, ZeroDivisionError):
+                pass
+            out.write(line + "\n")
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description="Benchmarks the conversion stages on synthetic calendars")
+    parser.add_argument('--events', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--workload', action='append', choices=sorted(WORKLOADS), dest='workloads')
+    parser.add_argument('--save', metavar='PATH', help="Write the results as JSON to PATH")
+    parser.add_argument('--compare', metavar='PATH', help="Compare with results saved by an earlier run")
+
+    settings = vars(parser.parse_args(args[1:]))
+    results = run_benchmarks(settings['events'], seed=settings['seed'], repeat=settings['repeat'],
+                             workloads=settings['workloads'])
+
+    baseline = None
+    if settings['compare']:
+        with open(settings['compare'], encoding='utf8') as stream:
+            baseline = json.load(stream)
+
+    _report(results, baseline)
+
+    if settings['save']:
+        with open(settings['save'], 'w', encoding='utf8') as stream:
+            json.dump(results, stream, indent=2, sort_keys=True)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
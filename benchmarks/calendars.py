@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+# MIT License
+
+# Copyright (c) 2019 Björn Larsson
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Seeded generator of synthetic calendars resembling Google Calendar and Office 365 exports
+
+    python -m benchmarks.calendars --events 10000 --seed 1 > large.ics
+"""
+
+import argparse
+import random
+import sys
+from datetime import datetime, timedelta
+
+_TIMEZONE = """BEGIN:VTIMEZONE
+TZID:Europe/Paris
+BEGIN:DAYLIGHT
+TZOFFSETFROM:+0100
+TZOFFSETTO:+0200
+TZNAME:CEST
+DTSTART:19700329T020000
+RRULE:FREQ=YEARLY;BYMONTH=3;BYDAY=-1SU
+END:DAYLIGHT
+BEGIN:STANDARD
+TZOFFSETFROM:+0200
+TZOFFSETTO:+0100
+TZNAME:CET
+DTSTART:19701025T030000
+RRULE:FREQ=YEARLY;BYMONTH=10;BYDAY=-1SU
+END:STANDARD
+END:VTIMEZONE"""
+
+_DAYS = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+_WORDS = ('Planning', 'Review', 'Standup', 'Lunch', 'Sync', 'Interview', 'Retro', 'Demo', 'Training',
+          'Offsite', 'Budget', 'Roadmap', 'Design', 'Release', 'Customer', 'Team', 'Weekly', 'Quarterly')
+
+
+def _fold(line):
+    """Folds a content line at 75 characters"""
+    parts = [line[:75]]
+    line = line[75:]
+    while line:
+        parts.append(" " + line[:74])
+        line = line[74:]
+    return "\r\n".join(parts)
+
+
+def _format(dt):
+    if isinstance(dt, datetime):
+        return dt.strftime("%Y%m%dT%H%M%S")
+    return dt.strftime("%Y%m%d")
+
+
+def _date_property(name, dt, utc):
+    if not isinstance(dt, datetime):
+        return "{};VALUE=DATE:{}".format(name, _format(dt))
+    if utc:
+        return "{}:{}Z".format(name, _format(dt))
+    return "{};TZID=Europe/Paris:{}".format(name, _format(dt))
+
+
+def _rule(rng, start):
+    """Returns a random RRULE value the converter supports"""
+    frequency = rng.choice(('DAILY', 'WEEKLY', 'WEEKLY', 'MONTHLY', 'YEARLY'))
+    parts = ["FREQ=" + frequency]
+
+    if frequency == 'WEEKLY':
+        parts.append("BYDAY=" + ",".join(sorted(rng.sample(_DAYS[:5], rng.randint(1, 5)), key=_DAYS.index)))
+    elif frequency == 'MONTHLY':
+        if rng.random() < 0.5:
+            parts.append("BYMONTHDAY={}".format(start.day))
+        else:
+            parts.append("BYDAY={}{}".format(rng.randint(1, 4), rng.choice(_DAYS[:5])))
+
+    if rng.random() < 0.3:
+        parts.append("INTERVAL={}".format(rng.randint(2, 4)))
+
+    limit = rng.random()
+    if limit < 0.3:
+        parts.append("COUNT={}".format(rng.randint(2, 50)))
+    elif limit < 0.6:
+        until = start + timedelta(days=rng.randint(30, 700))
+        parts.append("UNTIL=" + (_format(until) + "Z" if isinstance(until, datetime) else _format(until)))
+
+    return ";".join(parts)
+
+
+def generate_calendar(events=1000, seed=0, all_day=0.15, recurring=0.3, exdates=0.2, overrides=0.1,
+                      attachments=0.0):
+    """
+    Returns the text of a synthetic calendar
+
+    :param events: Number of VEVENT series in the calendar, overrides come in addition to these
+    :param seed: Seed for the random generator, the same arguments always give the same calendar
+    :param all_day: Share of events lasting whole days
+    :param recurring: Share of events with a recurrence rule
+    :param exdates: Average number of excluded dates per recurring event
+    :param overrides: Average number of RECURRENCE-ID overrides per recurring event
+    :param attachments: Share of events with attendees, an HTML description and an attachment
+    """
+    rng = random.Random(seed)
+    base = datetime(2019, 1, 7, 8, 0)
+    stamp = "20190216T084259Z"
+
+    lines = ["BEGIN:VCALENDAR",
+             "PRODID:-//ical2org-two//Benchmark {}//EN".format(seed),
+             "VERSION:2.0",
+             "CALSCALE:GREGORIAN",
+             "METHOD:PUBLISH",
+             _TIMEZONE]
+
+    for number in range(events):
+        uid = "{:08x}-{:04d}@benchmark".format(rng.getrandbits(32), number)
+        start = base + timedelta(days=rng.randint(-400, 400), minutes=15 * rng.randint(0, 40))
+        if rng.random() < all_day:
+            start = start.date()
+            end = start + timedelta(days=rng.randint(1, 3))
+        else:
+            end = start + timedelta(minutes=15 * rng.randint(1, 8))
+        utc = rng.random() < 0.3
+
+        event = ["BEGIN:VEVENT",
+                 _date_property("DTSTART", start, utc),
+                 _date_property("DTEND", end, utc),
+                 "DTSTAMP:" + stamp,
+                 "UID:" + uid,
+                 "CREATED:20190101T120000Z",
+                 "LAST-MODIFIED:20190201T120000Z",
+                 "SEQUENCE:0",
+                 "SUMMARY:" + " ".join(rng.sample(_WORDS, rng.randint(1, 4))),
+                 "LOCATION:Room {}".format(rng.randint(1, 50))]
+
+        if rng.random() < 0.5:
+            event.append("DESCRIPTION:" + "\\n".join(" ".join(rng.sample(_WORDS, 6)) for _ in range(3)))
+
+        if rng.random() < attachments:
+            event.extend("ATTENDEE;CN=Person {0};ROLE=REQ-PARTICIPANT:mailto:person{0}@example.com".format(n)
+                         for n in range(rng.randint(2, 20)))
+            event.append("X-ALT-DESC;FMTTYPE=text/html:<html><body>{}</body></html>".format("<p>text</p>" * 40))
+            event.append("ATTACH;ENCODING=BASE64;VALUE=BINARY;FMTTYPE=application/pdf:" + "QUJD" * 2000)
+
+        instances = list()
+        if rng.random() < recurring:
+            event.append("RRULE:" + _rule(rng, start))
+            step = timedelta(days=7)
+            while rng.random() < exdates / (1.0 + exdates):
+                instances.append(start + step * rng.randint(1, 20))
+            if instances:
+                event.append(",".join([_date_property("EXDATE", instances[0], utc)] + [
+                    _format(i) + ("Z" if utc and isinstance(i, datetime) else "") for i in instances[1:]]))
+
+            moved = list()
+            while rng.random() < overrides / (1.0 + overrides):
+                moved.append(start + step * rng.randint(21, 40))
+        else:
+            moved = list()
+
+        event.extend(["BEGIN:VALARM", "ACTION:DISPLAY", "DESCRIPTION:Reminder", "TRIGGER:-PT10M", "END:VALARM",
+                      "END:VEVENT"])
+        lines.extend(event)
+
+        for instance in moved:
+            shift = timedelta(hours=1) if isinstance(instance, datetime) else timedelta(days=1)
+            lines.extend(["BEGIN:VEVENT",
+                          _date_property("DTSTART", instance + shift, utc),
+                          _date_property("DTEND", instance + shift + (end - start), utc),
+                          "DTSTAMP:" + stamp,
+                          "UID:" + uid,
+                          _date_property("RECURRENCE-ID", instance, utc),
+                          "SEQUENCE:1",
+                          "SUMMARY:Moved instance",
+                          "END:VEVENT"])
+
+    lines.append("END:VCALENDAR")
+    return "".join(_fold(line) + "\r\n" for line in "\n".join(lines).split("\n"))
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description="Writes a synthetic calendar to stdout")
+    parser.add_argument('--events', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--all-day', type=float, default=0.15)
+    parser.add_argument('--recurring', type=float, default=0.3)
+    parser.add_argument('--exdates', type=float, default=0.2)
+    parser.add_argument('--overrides', type=float, default=0.1)
+    parser.add_argument('--attachments', type=float, default=0.0)
+
+    settings = vars(parser.parse_args(args[1:]))
+    sys.stdout.write(generate_calendar(**settings))
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+# MIT License
+
+# Copyright (c) 2019 Björn Larsson
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Measures the cold start cost of the command line tool with python -X importtime
+
+    python -m benchmarks.startup
+
+Each scenario runs in a fresh interpreter. The import time of every module loaded on behalf of
+ical2org, after the interpreter and site start up, is summed up and compared against a budget in
+milliseconds, the exit status is 1 if any scenario is over its budget. Python before 3.7 has no
+-X importtime, there only the wall time is shown.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_DATA = os.path.join(_ROOT, 'tests', 'data')
+
+SCENARIOS = {
+    'version': dict(args=['--version'], budget=100),
+    'convert': dict(args=['--input', os.path.join(_DATA, 'single-event.input'), '--output', os.devnull],
+                    budget=500),
+}
+
+# Python 3.7 added -X importtime, older versions ignore it
+IMPORTTIME = sys.version_info >= (3, 7)
+
+_PROGRAM = """
+import sys
+sys.stderr.write('start\\n')
+sys.stderr.flush()
+from ical2org.ical2org import convert
+try:
+    convert(['ical2org2'] + sys.argv[1:])
+except SystemExit:
+    pass
+sys.stderr.write('modules: ' + ' '.join(sorted(sys.modules)) + '\\n')
+"""
+
+
+def _parse(stderr):
+    """Returns the total import time in milliseconds and the loaded modules from -X importtime output"""
+    total = 0
+    modules = set()
+    started = False
+    for line in stderr.splitlines():
+        if line == 'start':
+            started = True  # Leaves out the imports of the interpreter and site
+        elif started and line.startswith('import time:'):
+            _, cumulative, name = line[len('import time:'):].split('|')
+            # Only top level imports, nested ones are part of their parent's cumulative time
+            if cumulative.strip().isdigit() and not name.startswith('  '):
+                total += int(cumulative)
+        elif line.startswith('modules: '):
+            modules = set(line[len('modules: '):].split())
+
+    return total / 1000.0, modules
+
+
+def measure(args):
+    """
+    Runs the tool with args in a fresh interpreter, returning import ms, wall ms and loaded modules
+
+    The import time is None where -X importtime is not available.
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [_ROOT, env.get('PYTHONPATH')]))
+    command = [sys.executable, '-X', 'importtime', '-c', _PROGRAM] + list(args)
+
+    started = time.perf_counter()
+    with open(os.devnull, 'w') as devnull:
+        process = subprocess.Popen(command, stdout=devnull, stderr=subprocess.PIPE, universal_newlines=True,
+                                   env=env)
+        _, stderr = process.communicate()
+    wall = (time.perf_counter() - started) * 1000.0
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, command, stderr)
+
+    imports, modules = _parse(stderr)
+    return imports if IMPORTTIME else None, wall, modules
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description="Checks the start up time of ical2org2 against a budget")
+    parser.add_argument('--scale', type=float, default=1.0, help="Multiply all budgets by SCALE")
+    settings = vars(parser.parse_args(args[1:]))
+
+    failed = False
+    for name, scenario in sorted(SCENARIOS.items()):
+        imports, wall, _ = measure(scenario['args'])
+        if imports is None:
+            sys.stdout.write("{:<10} wall {:7.1f} ms, imports need Python 3.7\n".format(name, wall))
+            continue
+
+        budget = scenario['budget'] * settings['scale']
+        status = "ok" if imports <= budget else "OVER BUDGET"
+        failed = failed or imports > budget
+        sys.stdout.write("{:<10} imports {:7.1f} ms (budget {:5.0f} ms), wall {:7.1f} ms  {}\n".format(
+            name, imports, budget, wall, status))
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
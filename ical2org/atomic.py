@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+# MIT License
+
+# Copyright (c) 2019 Björn Larsson
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Atomic replacement of output files
+"""
+
+import os
+import stat
+from contextlib import contextmanager
+
+
+def _umask():
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+def lines_digest(lines, volatile=()):
+    """Returns the SHA-1 of the bytes lines not starting with any of the prefixes in volatile"""
+    import hashlib
+
+    digest = hashlib.sha1()
+    for line in lines:
+        if not line.startswith(volatile):
+            digest.update(line)
+    return digest.hexdigest()
+
+
+def file_digest(path, volatile=()):
+    """Returns the lines_digest of a file, None if it can not be read"""
+    try:
+        with open(path, 'rb') as stream:
+            return lines_digest(stream, volatile)
+    except (IOError, OSError):
+        return None
+
+
+@contextmanager
+def atomic_write(path, encoding='utf8', volatile=None):
+    """
+    Opens path for writing through a temporary file that replaces path when the with block succeeds
+
+    Readers see either the old or the new content, never a partially written file. The temporary file is
+    removed if the block raises. Paths that exist but are not regular files, like /dev/null or a fifo, are
+    written directly since they can not be replaced, and symbolic links are followed so that their target
+    is replaced rather than the link itself. With volatile, a tuple of line prefixes, path is left
+    untouched when its content only differs from what was written in lines starting with one of them.
+    """
+    import tempfile
+
+    try:
+        info = os.stat(path)
+    except OSError:
+        info = None
+
+    if info is not None and not stat.S_ISREG(info.st_mode):
+        with open(path, 'w', encoding=encoding) as stream:
+            yield stream
+        return
+
+    # Links to pipes like /dev/stdout do not resolve to a path, so this is only done for regular files
+    path = os.path.realpath(path)
+    directory = os.path.dirname(path)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path) + '.')
+    try:
+        with os.fdopen(fd, 'w', encoding=encoding) as stream:
+            yield stream
+        if volatile is not None and info is not None and file_digest(tmp, volatile) == file_digest(path, volatile):
+            os.unlink(tmp)
+            return
+        os.chmod(tmp, stat.S_IMODE(info.st_mode) if info is not None else 0o666 & ~_umask())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+# MIT License
+
+# Copyright (c) 2019 Björn Larsson
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Converts many calendars in one invocation, spreading the work over a pool of processes
+"""
+
+import argparse
+import hashlib
+import os
+import signal
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from ical2org.atomic import atomic_write
+from ical2org.fetch import FeedCache, Fetcher, fetch_all, is_url
+from ical2org.ical2org import (VOLATILE_LINES, sigint_handler, set_timezone, _add_conversion_arguments,
+                               _cache_context, _expansion, _parsed_window, _read_file, _run_convert)
+from ical2org.version import version
+
+__description__ = "Converts many icalendar .ics files to org-agenda format in parallel"
+
+
+def _read_manifest(path):
+    """Returns the (input, output) pairs listed in a manifest, one tab separated pair per line"""
+    jobs = list()
+    with open(path, encoding='utf8') as stream:
+        for number, line in enumerate(stream, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+
+            pair = line.split('\t') if '\t' in line else line.split()
+            if len(pair) != 2:
+                raise ValueError("{}:{}: expected an input and an output path".format(path, number))
+            jobs.append(tuple(pair))
+
+    return jobs
+
+
+def _scan_directory(input_dir, output_dir):
+    """Returns an (input, output) pair for every .ics file in input_dir"""
+    jobs = list()
+    for name in sorted(os.listdir(input_dir)):
+        base, extension = os.path.splitext(name)
+        if extension.lower() == '.ics':
+            jobs.append((os.path.join(input_dir, name), os.path.join(output_dir, base + '.org')))
+
+    return jobs
+
+
+def _convert_one(job):
+    """Converts a single calendar, returning None on success and the error message on failure"""
+    _input, _output, options, body = job
+    options = dict(options)
+    volatile = VOLATILE_LINES if options.pop('keep_unchanged', False) else None
+    try:
+        _in = _read_file(_input) if body is None else body
+        with atomic_write(_output, volatile=volatile) as _out:
+            _run_convert(_in, _out, **options)
+    except Exception as e:
+        return "{}: {}".format(type(e).__name__, e)
+
+    return None
+
+
+def _fetch_feeds(urls, feeds, context, fetch_jobs, timeout):
+    """Fetches the (url, output) pairs concurrently, returning a Feed or the exception for each"""
+    fetcher = Fetcher(timeout)
+    try:
+        return fetch_all([(url, feeds.validators(url, os.path.abspath(output), context)) for url, output in urls],
+                         fetcher, fetch_jobs)
+    finally:
+        fetcher.close()
+
+
+def run_batch(jobs, processes=None, stream=False, cache_dir=None, timezone=None, window=None, expansion=None,
+              feed_cache=None, fetch_jobs=8, timeout=30.0, keep_unchanged=False):
+    """
+    Converts all (input, output) pairs in jobs, returning a list of (input, error) for the failed ones
+
+    Inputs may be http(s) URLs, which are all fetched first on fetch_jobs threads. Feeds answering
+    304 Not Modified to the validators kept in feed_cache are not converted again. Conversion errors are
+    collected rather than raised so that one broken feed does not abort the batch. With keep_unchanged,
+    outputs are only replaced if more than the CREATED time in their header changed.
+    """
+    set_timezone(timezone)
+    feeds = FeedCache(feed_cache)
+    context = "{} input None".format(_cache_context(window, expansion))
+
+    urls = [(_input, _output) for _input, _output in jobs if is_url(_input)]
+    fetched = dict(zip(urls, _fetch_feeds(urls, feeds, context, fetch_jobs, timeout))) if urls else dict()
+
+    work = list()
+    failures = list()
+    for _input, _output in jobs:
+        body = None
+        feed = fetched.get((_input, _output))
+        if isinstance(feed, Exception):
+            failures.append((_input, "{}: {}".format(type(feed).__name__, feed)))
+            continue
+        elif feed is not None:
+            if feed.status == 304:
+                continue
+            body = feed.body
+
+        cache = None
+        if cache_dir is not None:
+            source = _input if is_url(_input) else os.path.abspath(_input)
+            name = hashlib.sha1(source.encode('utf8')).hexdigest()
+            cache = os.path.join(cache_dir, name + '.json')
+        work.append((_input, _output, dict(stream=stream, cache=cache, timezone=timezone, window=window,
+                                           expansion=expansion, keep_unchanged=keep_unchanged), body))
+
+    if processes == 1 or len(work) <= 1:
+        results = [_convert_one(job) for job in work]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            results = list(pool.map(_convert_one, work))
+
+    for job, error in zip(work, results):
+        if error is not None:
+            failures.append((job[0], error))
+        elif job[3] is not None:
+            feeds.put(fetched[job[:2]], os.path.abspath(job[1]), context)
+    feeds.save()
+
+    return failures
+
+
+def convert_batch(args):
+    parser = argparse.ArgumentParser(description=__description__)
+    parser.add_argument('--version', action='version', version='%(prog)s {}'.format(version()))
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--manifest', metavar='PATH',
+                        help="File listing one tab separated input and output path per line")
+    source.add_argument('--input-dir', metavar='DIR', help="Convert every .ics file in DIR")
+    parser.add_argument('--output-dir', metavar='DIR', help="Where to write the .org files for --input-dir")
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 1,
+                        help="Number of calendars to convert in parallel")
+    parser.add_argument('--fetch-jobs', type=int, default=8,
+                        help="Number of URL inputs to fetch at the same time")
+    parser.add_argument('--cache-dir', metavar='DIR', default=None,
+                        help="Keep one series cache per input in DIR (implies --stream)")
+    _add_conversion_arguments(parser)
+
+    settings = vars(parser.parse_args(args[1:]))
+    if settings['jobs'] < 1 or settings['fetch_jobs'] < 1:
+        parser.error("--jobs and --fetch-jobs must be at least 1")
+    window = _parsed_window(parser, settings)
+
+    if settings['manifest']:
+        try:
+            jobs = _read_manifest(settings['manifest'])
+        except (IOError, OSError, ValueError) as e:
+            parser.error(str(e))
+    else:
+        output_dir = settings['output_dir'] or settings['input_dir']
+        os.makedirs(output_dir, exist_ok=True)
+        jobs = _scan_directory(settings['input_dir'], output_dir)
+
+    if settings['cache_dir'] is not None:
+        os.makedirs(settings['cache_dir'], exist_ok=True)
+
+    expansion = _expansion(settings['expand'], settings['expand_horizon'], settings['expand_limit'], window)
+    failures = run_batch(jobs, processes=settings['jobs'], stream=settings['stream'], cache_dir=settings['cache_dir'],
+                         timezone=settings['timezone'], window=window, expansion=expansion,
+                         feed_cache=settings['feed_cache'], fetch_jobs=settings['fetch_jobs'],
+                         timeout=settings['timeout'], keep_unchanged=settings['keep_unchanged'])
+    for _input, error in failures:
+        sys.stderr.write("{}: {}\n".format(_input, error))
+
+    return 1 if failures else 0
+
+
+def main():
+    signal.signal(signal.SIGINT, sigint_handler)
+    return convert_batch(sys.argv)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
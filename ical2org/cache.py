@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+# MIT License
+
+# Copyright (c) 2019 Björn Larsson
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Persistent cache of rendered org fragments, keyed per UID series
+"""
+
+import json
+
+from ical2org.atomic import atomic_write
+from ical2org.version import version
+
+
+class FragmentCache(object):
+    """
+    On disk cache of the rendered fragments of each series in a calendar
+
+    Each series is stored with a key made from its SEQUENCE, LAST-MODIFIED and a hash of its content.
+    Only series looked up during a run are written back, so series removed from the calendar are pruned.
+    Without a path the cache is only kept in memory, for processes converting the same calendar repeatedly.
+    The context names everything besides the event data that affects rendering, like the target timezone,
+    a cache written with another context or program version is discarded.
+    """
+
+    def __init__(self, path=None, context=""):
+        self._path = path
+        self._context = "{} {}".format(version(), context)
+        self._series = dict()
+        self._fresh = dict()
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    def _load(self):
+        if self._path is None:
+            return
+
+        try:
+            with open(self._path, encoding='utf8') as stream:
+                data = json.load(stream)
+        except (IOError, OSError, ValueError):
+            return
+
+        if isinstance(data, dict) and data.get('context') == self._context:
+            self._series = data.get('series', dict())
+
+    def get(self, uid, key, position):
+        """Returns the cached fragment for the event at position in the series, or None if it is stale"""
+        entry = self._series.get(uid)
+        if entry and entry['key'] == key and position < len(entry['fragments']):
+            self.hits += 1
+            return entry['fragments'][position]
+
+        self.misses += 1
+        return None
+
+    def put(self, uid, key, position, fragment):
+        """Stores the fragment for the event at position in the series, replacing fragments stored with another key"""
+        entry = self._fresh.get(uid)
+        if entry is None or entry['key'] != key:
+            entry = self._fresh[uid] = dict(key=key, fragments=list())
+        entry['fragments'][position:position + 1] = [fragment]
+
+    def save(self):
+        """Keeps the series seen since the last save, atomically replacing the cache file if there is one"""
+        if self._path is not None:
+            with atomic_write(self._path) as stream:
+                json.dump(dict(context=self._context, series=self._fresh), stream)
+
+        self._series = self._fresh
+        self._fresh = dict()
+
+    def discard(self):
+        """Forgets the series seen since the last save, after a conversion that did not complete"""
+        self._fresh = dict()
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+# MIT License
+
+# Copyright (c) 2019 Björn Larsson
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Fetching calendar feeds over HTTP(S) with conditional requests and persistent connections
+"""
+
+import codecs
+import json
+import os
+import threading
+from collections import namedtuple
+
+from ical2org.atomic import atomic_write
+from ical2org.version import version
+
+Feed = namedtuple('Feed', ('url', 'status', 'body', 'etag', 'last_modified'))
+
+_REDIRECTS = (301, 302, 303, 307, 308)
+_MAX_REDIRECTS = 5
+
+
+def is_url(value):
+    """Returns whether an input names an HTTP(S) feed rather than a file"""
+    return value.lower().startswith(('http://', 'https://'))
+
+
+def _utf8(body, charset):
+    """
+    Returns the bytes of a feed as UTF-8, the encoding iCalendar requires
+
+    Bodies are only transcoded if they are declared in another known charset, unknown ones are taken
+    to be mislabeled UTF-8.
+    """
+    try:
+        codec = codecs.lookup(charset or 'utf8').name
+    except LookupError:
+        return body
+    if codec in ('utf-8', 'ascii'):
+        return body
+    return body.decode(codec).encode('utf8')
+
+
+def _context(context):
+    return "{} {}".format(version(), context)
+
+
+class FeedCache(object):
+    """
+    ETag and Last-Modified of the feeds converted so far, kept between runs in a JSON file
+
+    The validators of a feed are stored with the output written from it and the context, the settings
+    that output was rendered with. They are only sent while that output still exists and the context is
+    the same, so a 304 Not Modified always means the output is up to date. Without a path the
+    validators are only kept in memory.
+    """
+
+    def __init__(self, path=None):
+        self._path = path
+        self._feeds = dict()
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if self._path is None:
+            return
+
+        try:
+            with open(self._path, encoding='utf8') as stream:
+                data = json.load(stream)
+        except (IOError, OSError, ValueError):
+            return
+
+        if isinstance(data, dict) and isinstance(data.get('feeds'), dict):
+            self._feeds = data['feeds']
+
+    def validators(self, url, output, context=""):
+        """Returns the request headers making a request for url conditional, if output is still up to date"""
+        with self._lock:
+            entry = self._feeds.get(url)
+        if entry is None or entry.get('output') != output or entry.get('context') != _context(context):
+            return dict()
+        if not os.path.exists(output):
+            return dict()
+
+        headers = dict()
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def put(self, feed, output, context=""):
+        """Stores the validators of a feed once output has been written from it"""
+        with self._lock:
+            self._feeds[feed.url] = dict(etag=feed.etag, last_modified=feed.last_modified, output=output,
+                                         context=_context(context))
+
+    def save(self):
+        if self._path is None:
+            return
+
+        with self._lock, atomic_write(self._path) as stream:
+            json.dump(dict(feeds=self._feeds), stream)
+
+
+class Fetcher(object):
+    """
+    Downloads feeds, keeping one open connection per host and thread for the following requests
+    """
+
+    def __init__(self, timeout=30.0):
+        self._timeout = timeout
+        self._local = threading.local()
+        self._connections = list()
+        self._lock = threading.Lock()
+
+    def _connection(self, scheme, host):
+        connections = getattr(self._local, 'connections', None)
+        if connections is None:
+            connections = self._local.connections = dict()
+
+        connection = connections.get((scheme, host))
+        if connection is None:
+            import http.client
+            if scheme == 'https':
+                connection = http.client.HTTPSConnection(host, timeout=self._timeout)
+            else:
+                connection = http.client.HTTPConnection(host, timeout=self._timeout)
+            connections[(scheme, host)] = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def _request(self, scheme, host, path, headers):
+        """Returns the response to a GET, retrying once on a fresh connection if a kept one was closed"""
+        import http.client
+
+        for attempt in (0, 1):
+            connection = self._connection(scheme, host)
+            try:
+                connection.request('GET', path, headers=headers)
+                response = connection.getresponse()
+                return response, response.read()
+            except (http.client.BadStatusLine, http.client.CannotSendRequest, ConnectionError):
+                connection.close()
+                if attempt:
+                    raise
+            except Exception:
+                connection.close()
+                raise
+
+    def fetch(self, url, headers=None):
+        """Returns the Feed at url, with status 304 and no body if the validators in headers still match"""
+        from urllib.parse import urljoin, urlsplit
+
+        request_headers = {'User-Agent': "ical2org/{}".format(version()), 'Accept-Encoding': 'identity'}
+        request_headers.update(headers or dict())
+
+        location = url
+        for _ in range(_MAX_REDIRECTS + 1):
+            parts = urlsplit(location)
+            path = parts.path or '/'
+            if parts.query:
+                path += '?' + parts.query
+
+            response, body = self._request(parts.scheme.lower(), parts.netloc, path, request_headers)
+            if response.status in _REDIRECTS and response.getheader('Location'):
+                location = urljoin(location, response.getheader('Location'))
+                continue
+            break
+        else:
+            raise IOError("{}: too many redirects".format(url))
+
+        if response.status == 304:
+            return Feed(url, 304, None, None, None)
+        if response.status != 200:
+            raise IOError("{}: HTTP {} {}".format(url, response.status, response.reason))
+
+        return Feed(url, 200, _utf8(body, response.msg.get_content_charset()), response.getheader('ETag'),
+                    response.getheader('Last-Modified'))
+
+    def close(self):
+        with self._lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections = list()
+
+
+def fetch_all(requests, fetcher, jobs=8):
+    """
+    Fetches (url, headers) pairs on at most jobs threads, returning a Feed or the exception for each
+
+    Connections are reused between the requests handled by the same thread.
+    """
+    def _fetch(request):
+        try:
+            return fetcher.fetch(*request)
+        except Exception as e:
+            return e
+
+    if jobs == 1 or len(requests) <= 1:
+        return [_fetch(request) for request in requests]
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(_fetch, requests))
@@ -27,54 +27,140 @@
 """
 
 import argparse
+import codecs
+import copy
+import io
+import mmap
+import os
 import re
+import stat
 import sys
 import signal
+import time
+from collections import Counter, OrderedDict, defaultdict
+from contextlib import contextmanager
 from datetime import datetime, date, timedelta
-from itertools import groupby
+from functools import lru_cache
+from itertools import chain
 from operator import attrgetter
 from string import Template
 
-from dateutil import tz
-from dateutil.relativedelta import relativedelta
-from icalendar import Calendar as iCal
-
+from ical2org.atomic import atomic_write
+from ical2org.cache import FragmentCache
+from ical2org.fetch import is_url
+from ical2org.stats import Stats
 from ical2org.version import version
+from ical2org.watch import watcher
 
 __description__ = "Converts icalander .ics files to org-agenda format"
 
+# icalendar, dateutil and the other heavier modules are imported where they are first needed rather than
+# here, so that --version, --help and argument errors do not pay for importing them.
+
 
 def sigint_handler(_, __):
     sys.exit(0)
 
 
+_timezone = None
+_timezone_name = None
+
+# Abbreviated day names of the current locale, as given by %a, indexed by date.weekday()
+_WEEKDAYS = tuple(date(2001, 1, day).strftime("%a") for day in range(1, 8))
+
+
+def set_timezone(name=None):
+    """Sets the timezone events are converted to, the local timezone of the host if name is None"""
+    global _timezone, _timezone_name
+
+    if _timezone is not None and name == _timezone_name:
+        return
+
+    from dateutil import tz
+
+    if name is None:
+        zone = tz.tzlocal()
+    else:
+        zone = tz.gettz(name)
+        if zone is None:
+            raise ValueError("Unknown timezone: {}".format(name))
+
+    _timezone = zone
+    _timezone_name = name
+    for memoized in _MEMOIZED:
+        memoized.cache_clear()
+
+
+def timezone_name():
+    """Returns a name identifying the timezone events are converted to"""
+    return _timezone_name or "/".join(time.tzname)
+
+
+@lru_cache(maxsize=4096)
 def _localized_time(dt):
-    """Convert a datetime object to local time"""
+    """Convert a datetime object to the target timezone"""
     if isinstance(dt, datetime):
-        return dt.astimezone(tz.tzlocal())
+        if _timezone is None:
+            set_timezone()
+        return dt.astimezone(_timezone)
     else:
         return dt
 
 
+@lru_cache(maxsize=4096)
+def _org_clock(dt):
+    """Returns the localized time of day as HH:MM"""
+    t = _localized_time(dt)
+    return "{:02d}:{:02d}".format(getattr(t, 'hour', 0), getattr(t, 'minute', 0))
+
+
+@lru_cache(maxsize=4096)
+def _org_block_date(dt):
+    """Returns the localized date as used in diary-block"""
+    t = _localized_time(dt)
+    return "{:02d} {:02d} {}".format(t.month, t.day, t.year)
+
+
 def _org_time(start, end):
     """"""
-    start = _localized_time(start)
-    end = _localized_time(end)
-    return "{}--{} ".format(start.strftime("%H:%M"), end.strftime("%H:%M"))  # Note the extra padding
+    return "{}--{} ".format(_org_clock(start), _org_clock(end))  # Note the extra padding
 
 
+@lru_cache(maxsize=4096)
+def _org_day(dt):
+    """Returns the localized date as YYYY-MM-DD Day, the date part of org-mode timestamps"""
+    t = _localized_time(dt)
+    return "{}-{:02d}-{:02d} {}".format(t.year, t.month, t.day, _WEEKDAYS[t.weekday()])
+
+
+@lru_cache(maxsize=4096)
 def _org_timestamp(dt):
     """Returns a org-mode passive timestamp"""
-    t = _localized_time(dt)
-    return "[{}]".format(t.strftime("%Y-%m-%d %a %H:%M"))
+    return "[{} {}]".format(_org_day(dt), _org_clock(dt))
+
+
+def _org_active(start, end):
+    """Returns the org-mode active timestamp, or range of timestamps, of an instance from start to end"""
+    if not isinstance(start, datetime):
+        last = end - timedelta(days=1)  # DTEND of all day events is exclusive
+        if last <= start:
+            return "<{}>".format(_org_day(start))
+        return "<{}>--<{}>".format(_org_day(start), _org_day(last))
+
+    if end == start:
+        return "<{} {}>".format(_org_day(start), _org_clock(start))
+    if _org_day(start) == _org_day(end):
+        return "<{} {}-{}>".format(_org_day(start), _org_clock(start), _org_clock(end))
+    return "<{} {}>--<{} {}>".format(_org_day(start), _org_clock(start), _org_day(end), _org_clock(end))
 
 
 def _org_range(start, end):
     """"""
-    start = _localized_time(start)
-    end = _localized_time(end)
-    return "(diary-block {start} {end})".format(start=start.strftime("%m %d %Y"),
-                                                end=end.strftime("%m %d %Y"))
+    return "(diary-block {start} {end})".format(start=_org_block_date(start),
+                                                end=_org_block_date(end))
+
+
+_MEMOIZED = (_localized_time, _org_clock, _org_block_date, _org_day, _org_timestamp)
 
 
 def _org_date(_date):
@@ -84,30 +170,37 @@ def _org_date(_date):
                                                       year=_date.year)
 
 
-def _org_recurrence_range(rule, start):
-    if 'UNTIL' in rule:
-        end = _localized_time(rule['UNTIL'][0])
-        return _org_range(start, end)
-
-    elif 'COUNT' in rule:
-        interval = rule.get('INTERVAL', [1])[0]
-        count = rule.get('COUNT', [1])[0]
-        frequency = rule['FREQ'][0]
-
-        if frequency == 'YEARLY':
-            delta = relativedelta(years=(count * interval))
-        elif frequency == 'MONTHLY':
-            delta = relativedelta(months=count * interval)
-        elif frequency == 'WEEKLY':
-            delta = relativedelta(weeks=(count * interval) / len(rule['BYDAY']))
-        elif frequency == 'DAILY':
-            delta = relativedelta(days=(count * interval))
-        else:
-            delta = timedelta()
+_RELATIVE_DAY = re.compile(r"(?P<number>\d)(?P<day>[FMSTW][AEHROU])")
+_DAY_NUMBERS = {"SU": 0, "MO": 1, "TU": 2, "WE": 3, "TH": 4, "FR": 5, "SA": 6}
+
+_INTERVAL_TEMPLATES = {
+    'DAILY': "(eq 0 (% (- (calendar-absolute-from-gregorian date) \
+(calendar-absolute-from-gregorian '({month} {day} {year}))) {interval}))",
+    'WEEKLY': "(eq 0 (% (/ (- (calendar-absolute-from-gregorian date) \
+(calendar-absolute-from-gregorian '({month} {day} {year}))) 7) {interval}))",
+    'MONTHLY': "(eq 0 (% (+ (* (- (nth 2 date) {year}) 12) (- (nth 0 date) {month})) {interval}))",
+    'YEARLY': "(eq 0 (% (- (nth 2 date) {year}) {interval}))",
+}
+
+
+def _org_recurrence_delta(rule):
+    """Returns the time from the first to the last instance of a rule limited by COUNT"""
+    from dateutil.relativedelta import relativedelta
 
-        return _org_range(start, start + delta)
+    interval = rule.get('INTERVAL', [1])[0]
+    count = rule.get('COUNT', [1])[0]
+    frequency = rule['FREQ'][0]
+
+    if frequency == 'YEARLY':
+        return relativedelta(years=(count * interval))
+    elif frequency == 'MONTHLY':
+        return relativedelta(months=count * interval)
+    elif frequency == 'WEEKLY':
+        return relativedelta(weeks=(count * interval) / len(rule['BYDAY']))
+    elif frequency == 'DAILY':
+        return relativedelta(days=(count * interval))
     else:
-        return ""
+        return timedelta()
 
 
 def _org_days(rule):
@@ -120,16 +213,15 @@ def _org_days(rule):
     else:
         day_names = list()
         relative_days = list()
-        lookup = {"SU": 0, "MO": 1, "TU": 2, "WE": 3, "TH": 4, "FR": 5, "SA": 6}
 
         for day in rule['BYDAY']:
-            match = re.match(r"(?P<number>\d)(?P<day>[FMSTW][AEHROU])", day)
+            match = _RELATIVE_DAY.match(day)
 
             if match:
-                relative_days.append("(diary-float t {day} {number})".format(day=lookup[match.group('day')],
+                relative_days.append("(diary-float t {day} {number})".format(day=_DAY_NUMBERS[match.group('day')],
                                                                              number=match.group('number')))
             else:
-                day_names.append(str(lookup[day]))
+                day_names.append(str(_DAY_NUMBERS[day]))
 
         days = "(memq (calendar-day-of-week date) '({}))".format(' '.join(day_names)) if len(day_names) > 0 else ""
         return "{} {}".format(' '.join(relative_days), days)
@@ -139,117 +231,410 @@ def _org_months(rule):
     if 'BYMONTH' not in rule:
         return ""
 
-    months = ' '.join(rule['BYMONTH'])
+    months = ' '.join(str(month) for month in rule['BYMONTH'])
     return "(memq (nth 0 date) '({months}))".format(months=months)
 
 
-def _org_interval(rule, start):
-    if 'INTERVAL' not in rule:
-        return ""
+class _CompiledRule(object):
+    """
+    The parts of the diary sexp for a recurrence rule, compiled once per distinct rule
 
-    interval = rule['INTERVAL'][0]
-    frequency = rule['FREQ'][0]
-    start = _localized_time(start)
-
-    if frequency == 'DAILY':
-        return "(eq 0 (% (- (calendar-absolute-from-gregorian date) \
-(calendar-absolute-from-gregorian '({month} {day} {year}))) {interval}))".format(interval=interval,
-                                                                                 month=start.month,
-                                                                                 day=start.day,
-                                                                                 year=start.year)
-    elif frequency == 'WEEKLY':
-        return "(eq 0 (% (/ (- (calendar-absolute-from-gregorian date) \
-(calendar-absolute-from-gregorian '({month} {day} {year}))) 7) {interval}))".format(interval=interval,
-                                                                                    month=start.month,
-                                                                                    day=start.day,
-                                                                                    year=start.year)
-    elif frequency == 'MONTHLY':
-        return "(eq 0 (% (+ (* (- (nth 2 date) {year}) 12) \
-(- (nth 0 date) {month})) {interval}))".format(interval=interval, month=start.month, day=start.day, year=start.year)
-    elif frequency == 'YEARLY':
-        return "(eq 0 (% (- (nth 2 date) {year}) {interval}))".format(interval=interval,
-                                                                      month=start.month,
-                                                                      day=start.day,
-                                                                      year=start.year)
-    else:
-        return ""
+    Everything that only depends on the rule is rendered up front, the parts depending on the start
+    of the event are filled in by range() and interval().
+    """
+    __slots__ = ('frequency', 'template', 'until', 'delta', 'interval_template', '_text', '_recurrence')
+
+    def __init__(self, rule):
+        self.frequency = rule['FREQ'][0]
+        self._text = ";".join("{}={}".format(name, ",".join(str(value) for value in values))
+                              for name, values in rule.items() if name != 'UNTIL')
+        self._recurrence = None
+        self.until = rule['UNTIL'][0] if 'UNTIL' in rule else None
+        self.delta = _org_recurrence_delta(rule) if self.until is None and 'COUNT' in rule else None
+
+        self.interval_template = None
+        if 'INTERVAL' in rule and self.frequency in _INTERVAL_TEMPLATES:
+            self.interval_template = _INTERVAL_TEMPLATES[self.frequency].replace(
+                "{interval}", str(rule['INTERVAL'][0]))
+
+        # The static parts are substituted right away, leaving a template for the per event parts
+        self.template = Template("%%(and ${date} " + _org_days(rule) + " ${range} ${interval} " + _org_months(rule) +
+                                 " ${exception}) ${time}${summary}")
+
+    def end(self, start):
+        """Returns the start of the last instance, None for rules without an end"""
+        if self.until is not None:
+            return self.until
+        if self.delta is not None:
+            return start + self.delta
+        return None
+
+    def range(self, start):
+        end = self.end(start)
+        return "" if end is None else _org_range(start, end)
+
+    def interval(self, start):
+        if self.interval_template is None:
+            return ""
 
+        start = _localized_time(start)
+        return self.interval_template.format(month=start.month, day=start.day, year=start.year)
 
-def _org_exceptions(exceptions, extra):
-    result = list()
+    def recurrence(self, start, until=None):
+        """Returns a dateutil rrule for the naive datetime start, the rule text is only parsed once"""
+        if self._recurrence is None:
+            from dateutil.rrule import rrulestr
+            self._recurrence = rrulestr(self._text, dtstart=datetime(2000, 1, 1), cache=False)
+        return self._recurrence.replace(dtstart=start, until=until)
+
+
+def _rule_key(rule):
+    """Returns a hashable key identifying a recurrence rule"""
+    return tuple(sorted((name.upper(), tuple(values) if isinstance(values, (list, tuple)) else (values,))
+                        for name, values in rule.items()))
 
-    if exceptions:
-        if isinstance(exceptions, list):
-            for e in exceptions:
-                result.extend(["(not {date})".format(date=_org_date(d.dt)) for d in e.dts])
-        else:
-            result.extend(["(not {date})".format(date=_org_date(d.dt)) for d in exceptions.dts])
 
-    if extra:
-        if not isinstance(extra, (list, tuple)):
-            extra = tuple(extra)
-        result.extend(["(not {})".format(_org_date(getattr(e, 'RECURRENCE-ID', None).dt)) for e in extra])
+@lru_cache(maxsize=1024)
+def _compile_rule_key(key):
+    return _CompiledRule(dict(key))
 
-    return " ".join(result)
+
+def _compile_rule(rule):
+    """Returns the compiled form of a vRecur rule, shared between all events with an identical rule"""
+    return _compile_rule_key(_rule_key(rule))
+
+
+def _org_exceptions(exceptions, extra):
+    """Returns the sexp excluding all EXDATE dates in exceptions and the overridden dates in extra"""
+    result = OrderedDict()
+    for d in chain(exceptions, extra):
+        key = (d.year, d.month, d.day)
+        if key not in result:
+            result[key] = "(not {date})".format(date=_org_date(d))
+
+    return " ".join(result.values())
 
 
 def _yearly_date(dt):
     return "(diary-date {month} {day} t)".format(month=dt.month, day=dt.day)
 
 
-class Event(object):
+# A content line with its folded continuation lines, the first group is the line without its line end and
+# the second the property name. Long values like base64 attachments are skipped over by the regular
+# expression engine rather than looked at line by line.
+_CONTENT_LINE = re.compile(rb"(([A-Za-z0-9-]*)[^\n]*(?:\n[ \t][^\n]*)*)\n?")
+_FOLD = re.compile(rb"\r?\n[ \t]")
+_BEGIN = b"BEGIN"
+_END = b"END"
+
+
+def _iter_lines(buffer):
+    """Yields the upper case property name, start and end offset of every unfolded content line of a buffer"""
+    position = len(codecs.BOM_UTF8) if buffer[:len(codecs.BOM_UTF8)] == codecs.BOM_UTF8 else 0
+    for match in _CONTENT_LINE.finditer(buffer, position):
+        key = match.group(2)
+        if key:
+            start, end = match.span(1)
+            yield key.upper(), start, end
+
+
+def _line(buffer, start, end):
+    """Returns the unfolded and decoded content line between start and end"""
+    line = buffer[start:end]
+    if b"\n" in line:
+        line = _FOLD.sub(b"", line)
+    return line.rstrip(b"\r").decode('utf8')
+
+
+def _iter_blocks(buffer, wanted):
+    """Yields (name, lines, start, end) for every top level item in a calendar buffer
+
+    Components nested directly in the VCALENDAR are yielded with their name, the offsets of the block
+    and its BEGIN and END lines. Only the properties listed for the component in wanted are decoded
+    and included in lines, None meaning everything including nested components. Components not
+    in wanted are skipped. Calendar properties are yielded with None as name and a single line.
     """
+    wanted = dict((name, None if names is None else frozenset(n.encode('ascii') for n in names))
+                  for name, names in wanted.items())
+    name = None
+    names = None
+    block = None
+    block_start = 0
+    depth = 0
+
+    for key, start, end in _iter_lines(buffer):
+        if key == _BEGIN:
+            depth += 1
+            if depth == 2:
+                name = _line(buffer, start, end)[6:].strip().upper()
+                names = wanted.get(name, False)
+                block = None if names is False else [_line(buffer, start, end)]
+                block_start = start
+            elif depth > 2 and block is not None and names is None:
+                block.append(_line(buffer, start, end))
+        elif key == _END:
+            depth -= 1
+            if block is not None and (depth == 1 or names is None):
+                block.append(_line(buffer, start, end))
+            if depth == 1 and name is not None:
+                if block is not None:
+                    yield name, block, block_start, end
+                name = None
+                block = None
+        elif depth == 1:
+            yield None, [_line(buffer, start, end)], start, end
+        elif block is not None and (names is None or (depth == 2 and key in names)):
+            block.append(_line(buffer, start, end))
+
+
+def _parse_ical(text):
+    """Parses iCalendar text into an icalendar component"""
+    from icalendar import Calendar as iCal
+    return iCal.from_ical(text)
+
+
+def _content_line_parts(line):
+    """Returns the name, parameters and raw value of a content line"""
+    from icalendar.parser import Contentline
+    return Contentline(line).parts()
+
+
+_PROPERTY_NAME = re.compile(r"[A-Za-z0-9-]+")
+
+# The properties Event.from_component reads, all others are left undecoded
+_EVENT_PROPERTIES = frozenset(('UID', 'SUMMARY', 'DTSTART', 'DTEND', 'DURATION', 'RRULE', 'EXDATE',
+                               'RECURRENCE-ID', 'LOCATION', 'CREATED', 'LAST-MODIFIED', 'DESCRIPTION'))
+
+# The components read from a calendar and their properties that are decoded, None for all
+_CALENDAR_BLOCKS = {'VEVENT': _EVENT_PROPERTIES | frozenset(('SEQUENCE',)),
+                    'VTIMEZONE': None}
+
+
+def _iter_properties(lines, names):
+    """Yields the content lines of the given properties of a component, nested components excluded
+
+    Only the name at the start of each line is looked at, so long values like base64 ATTACH payloads
+    are neither copied nor decoded.
+    """
+    depth = 0
+
+    for line in lines:
+        upper = line[:6].upper()
+        if upper == "BEGIN:":
+            depth += 1
+        elif upper[:4] == "END:":
+            depth -= 1
+        elif depth == 1:
+            match = _PROPERTY_NAME.match(line)
+            if match is not None and match.group().upper() in names:
+                yield line
+
+
+def _block_properties(lines, names):
+    """Returns the raw values of the given properties in a component, nested components excluded"""
+    result = dict()
+    for line in _iter_properties(lines, names):
+        name, _, value = _content_line_parts(line)
+        result.setdefault(name.upper(), value)
+
+    return result
+
+
+def _event_text(lines):
+    """Returns the text of a VEVENT reduced to the properties Event uses, without VALARMs and the like"""
+    return "\r\n".join(chain((lines[0],), _iter_properties(lines, _EVENT_PROPERTIES), (lines[-1],)))
+
+
+def _rule_frequency(value):
+    """Returns the FREQ part of a raw RRULE value"""
+    for part in value.split(';'):
+        name, _, frequency = part.partition('=')
+        if name.strip().upper() == 'FREQ':
+            return frequency.strip().upper()
+    return None
+
+
+def _map_file(stream):
+    """Returns a read only memory map of the regular file behind a binary stream, None if there is none"""
+    try:
+        info = os.fstat(stream.fileno())
+    except (AttributeError, OSError, ValueError):
+        return None
+
+    if not stat.S_ISREG(info.st_mode) or info.st_size == 0:
+        return None
+    return mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+
 
+def _at_start(stream):
+    try:
+        return stream.tell() == 0
+    except (AttributeError, OSError, ValueError):
+        return False
+
+
+def _input_buffer(stream, spool=False):
+    """
+    Returns the content of a binary or text stream as a bytes-like buffer
+
+    Regular files are memory-mapped rather than read, other binary streams like stdin are read in
+    blocks. With spool, they are written to a temporary file that is mapped instead of being kept in
+    memory. Text streams without an underlying binary stream are encoded as UTF-8.
+    """
+    if isinstance(stream, (bytes, bytearray, mmap.mmap)):
+        return stream
+
+    binary = getattr(stream, 'buffer', None) if isinstance(stream, io.TextIOBase) else stream
+    if binary is not None:
+        if _at_start(stream):
+            mapped = _map_file(binary)
+            if mapped is not None:
+                return mapped
+
+        def read():
+            return binary.read(1 << 16)
+    else:
+        def read():
+            return stream.read(1 << 16).encode('utf8')
+
+    if not spool:
+        return b"".join(iter(read, b""))
+
+    import tempfile
+
+    with tempfile.TemporaryFile() as temporary:
+        for chunk in iter(read, b""):
+            temporary.write(chunk)
+        temporary.flush()
+        # The mapping stays valid after the file is closed
+        return _map_file(temporary) or b""
+
+
+def _read_file(path):
+    """
+    Returns the content of the file at path, read rather than memory-mapped
+
+    Reading a mapped file that another process truncates raises SIGBUS and kills the process, which is
+    acceptable for a single conversion but not for the long running watch and batch modes.
     """
+    with open(path, 'rb') as stream:
+        return stream.read()
+
+
+def _buffered(chunks, size=1 << 16):
+    """Joins small chunks into strings of roughly size characters, limiting the number of writes"""
+    pending = list()
+    length = 0
+
+    for chunk in chunks:
+        pending.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield "".join(pending)
+            pending = list()
+            length = 0
+
+    if pending:
+        yield "".join(pending)
+
+
+class Event(object):
+    """
+    Normalized record of the VEVENT properties used when rendering
+    """
+    __slots__ = ('uid', 'summary', 'start', 'end', 'rule', 'exdates', 'recurrence_id',
+                 'location', 'created', 'last_modified', 'description', 'all_day')
+
     __event_template__ = Template("* ${summary}\n${time}\n\t:PROPERTIES:\n${properties}\n\t:END:\n${description}\n")
     __property_template = Template("\t:${name}: ${value}")
-    __recurring_template = Template(
-        "%%(and ${date} ${byday} ${range} ${interval} ${bymonth} ${exception}) ${time}${summary}")
 
-    def __init__(self, **kwargs):
-        self._data = kwargs
+    def __init__(self, uid, summary, start, end, rule=None, exdates=(), recurrence_id=None,
+                 location=None, created=None, last_modified=None, description=None):
+        self.uid = uid
+        self.summary = summary
+        self.start = start
+        self.end = end
+        self.rule = rule
+        self.exdates = exdates
+        self.recurrence_id = recurrence_id
+        self.location = location
+        self.created = created
+        self.last_modified = last_modified
+        self.description = description
+        self.all_day = type(start) is date
+
+    @classmethod
+    def from_component(cls, component):
+        """Creates an event from a parsed icalendar VEVENT component"""
+        start = component['DTSTART'].dt
+
+        if 'DTEND' in component:
+            end = component['DTEND'].dt
+        elif 'DURATION' in component:
+            end = start + component['DURATION'].dt
+        else:
+            end = start + timedelta(days=1) if type(start) is date else start
+
+        exdates = component.get('EXDATE')
+        if exdates is None:
+            exdates = ()
+        else:
+            exdates = tuple(d.dt for e in (exdates if isinstance(exdates, list) else [exdates]) for d in e.dts)
+
+        def _optional(name, transform):
+            value = component.get(name)
+            return None if value is None else transform(value)
+
+        return cls(uid=str(component['UID']),
+                   summary=str(component.get('SUMMARY', "")),
+                   start=start,
+                   end=end,
+                   rule=component.get('RRULE'),
+                   exdates=exdates,
+                   recurrence_id=_optional('RECURRENCE-ID', attrgetter('dt')),
+                   location=_optional('LOCATION', str),
+                   created=_optional('CREATED', attrgetter('dt')),
+                   last_modified=_optional('LAST-MODIFIED', attrgetter('dt')),
+                   description=_optional('DESCRIPTION', str))
 
     def is_recurring(self):
-        return hasattr(self, 'RRULE')
+        return self.rule is not None
 
     def is_all_day(self):
-        return type(self._data['DTSTART'].dt) is date
+        return self.all_day
 
     def _get_properties(self):
         props = [self.__property_template.substitute({'name': "ID",
-                                                      "value": self._data['UID']})]
-        if 'LOCATION' in self._data:
+                                                      "value": self.uid})]
+        if self.location is not None:
             props.append(self.__property_template.substitute({'name': "LOCATION",
-                                                              "value": self._data['LOCATION']}))
+                                                              "value": self.location}))
 
-        if 'CREATED' in self._data:
+        if self.created is not None:
             props.append(self.__property_template.substitute({'name': 'CREATED',
-                                                              'value': _org_timestamp(self._data['CREATED'].dt)}))
-        if 'LAST-MODIFIED' in self._data:
+                                                              'value': _org_timestamp(self.created)}))
+        if self.last_modified is not None:
             props.append(self.__property_template.substitute({'name': "LAST-MODIFIED",
-                                                              'value': _org_timestamp(self._data['LAST-MODIFIED'].dt)}))
+                                                              'value': _org_timestamp(self.last_modified)}))
 
         return "\n".join(props)
 
     def _get_recurring_time(self, exceptions):
-        frequency = self.RRULE['FREQ'][0]
-        _date = _yearly_date(self.DTSTART.dt) if frequency == 'YEARLY' else ""
-        _exceptions = getattr(self, 'EXDATE', None)
-        return self.__recurring_template.substitute(date=_date,
-                                                    summary=self.SUMMARY,
-                                                    byday=_org_days(self.RRULE),
-                                                    bymonth=_org_months(self.RRULE),
-                                                    exception=_org_exceptions(_exceptions, exceptions),
-                                                    range=_org_recurrence_range(self.RRULE, self.DTSTART.dt),
-                                                    interval=_org_interval(self.RRULE, self.DTSTART.dt),
-                                                    time=_org_time(self.DTSTART.dt, self.DTEND.dt))
+        rule = _compile_rule(self.rule)
+        _date = _yearly_date(self.start) if rule.frequency == 'YEARLY' else ""
+        return rule.template.substitute(date=_date,
+                                        summary=self.summary,
+                                        exception=_org_exceptions(self.exdates, exceptions),
+                                        range=rule.range(self.start),
+                                        interval=rule.interval(self.start),
+                                        time=_org_time(self.start, self.end))
 
     def _get_instance_time(self):
-        time = "" if self.is_all_day() else _org_time(self.DTSTART.dt, self.DTEND.dt)
-        end = self.DTEND.dt - timedelta(days=1) if self.is_all_day() else self.DTEND.dt
-        return "%%(and {range}) {time}{summary}".format(summary=self.SUMMARY,
+        time = "" if self.all_day else _org_time(self.start, self.end)
+        end = self.end - timedelta(days=1) if self.all_day else self.end
+        return "%%(and {range}) {time}{summary}".format(summary=self.summary,
                                                         time=time,
-                                                        range=_org_range(self.DTSTART.dt, end))
+                                                        range=_org_range(self.start, end))
 
     def _get_time(self, exceptions):
         if self.is_recurring():
@@ -257,84 +642,815 @@ class Event(object):
         return self._get_instance_time()
 
     def _get_description(self):
-        desc = self._data.get('DESCRIPTION', None)
-
-        if desc:
-            return "** Description:\n\t{}".format(desc.replace('\n', '\n\t'))
+        if self.description:
+            return "** Description:\n\t{}".format(self.description.replace('\n', '\n\t'))
         else:
             return ""
 
     def __str__(self):
         return "Event"
 
-    def to_org(self, exceptions):
+    def to_org(self, exceptions, expansion=None):
+        time = None if expansion is None else expansion.timestamps(self, exceptions)
         data = dict(properties=self._get_properties(),
-                    time=self._get_time(exceptions),
-                    summary=self._data['SUMMARY'],
+                    time=self._get_time(exceptions) if time is None else time,
+                    summary=self.summary,
                     description=self._get_description())
         return self.__event_template__.substitute(data)
 
-    def __lt__(self, other):
-        if self.UID == other.UID:
-            return hasattr(self, 'RRULE')
-        return self.UID < other.UID
 
-    def __getattr__(self, item):
-        try:
-            return self._data[item]
-        except KeyError:
-            raise AttributeError("No such attribute: {}".format(item))
+class Series(object):
+    """
+    All events sharing a UID, the master events and the overrides of single instances
+    """
+    __slots__ = ('uid', 'events', 'overrides')
+
+    def __init__(self, uid):
+        self.uid = uid
+        self.events = list()
+        self.overrides = list()
+
+    def add(self, event):
+        if event.recurrence_id is None:
+            self.events.append(event)
+        else:
+            self.overrides.append(event)
+
+    def excluded(self):
+        """Returns the dates of the instances replaced by overrides"""
+        return [e.recurrence_id for e in self.overrides]
+
+    def first(self):
+        return self.events[0] if self.events else self.overrides[0]
+
+    def __iter__(self):
+        """Iterates over the events in the series, the master events first"""
+        return chain(self.events, self.overrides)
+
+
+def _local_date(dt):
+    """Returns the date of dt in the target timezone"""
+    return _localized_time(dt).date() if isinstance(dt, datetime) else dt
+
+
+class Window(object):
+    """
+    Range of dates, inclusive, outside of which events are left out of the output
+
+    Either end may be None for an open range. Only the start, end and recurrence rule of an event are
+    looked at, so events are pruned before any formatting is done.
+    """
+    __slots__ = ('start', 'end')
+
+    def __init__(self, start=None, end=None):
+        self.start = start
+        self.end = end
+
+    def contains(self, event):
+        """Returns whether any instance of event may fall inside the window"""
+        if self.end is not None and _local_date(event.start) > self.end:
+            return False
+        if self.start is None:
+            return True
+
+        last = event.end
+        if event.rule is not None:
+            # Same end of the series as used for the diary-block of the rule
+            until = _compile_rule(event.rule).end(event.start)
+            if until is None:
+                return True
+            last = until + (event.end - event.start)
+
+        last = _local_date(last)
+        if event.all_day and isinstance(last, date) and not isinstance(last, datetime):
+            last -= timedelta(days=1)  # DTEND of all day events is exclusive
+        return last >= self.start
+
+    def __repr__(self):
+        return "Window({}, {})".format(self.start, self.end)
+
+
+def _naive_until(until, start):
+    """Returns the UNTIL of a rule as a naive datetime in the wall time of the naive or aware start"""
+    if not isinstance(until, datetime):
+        return datetime(until.year, until.month, until.day, 23, 59, 59)
+    if until.tzinfo is not None and start.tzinfo is not None:
+        until = until.astimezone(start.tzinfo)
+    return until.replace(tzinfo=None)
+
+
+def _localize(naive, tzinfo):
+    """Attaches tzinfo to a naive wall time, with localize for pytz zones whose offset replace would not pick"""
+    localize = getattr(tzinfo, 'localize', None)
+    return naive.replace(tzinfo=tzinfo) if localize is None else localize(naive)
+
+
+def _day_key(dt, tzinfo):
+    """Returns (year, month, day) of dt in the timezone tzinfo, if both are aware"""
+    if isinstance(dt, datetime) and dt.tzinfo is not None and tzinfo is not None:
+        dt = dt.astimezone(tzinfo)
+    return dt.year, dt.month, dt.day
+
+
+class Expansion(object):
+    """
+    Settings for rendering events as org-mode active timestamps instead of diary sexps
+
+    Emacs evaluates every diary sexp for every day shown in the agenda, while plain timestamps are
+    only looked up. Series are expanded to one timestamp per instance when they end on or before end
+    and have at most limit instances from start on, unbounded and denser series are kept as sexps.
+    """
+    __slots__ = ('start', 'end', 'limit')
+
+    def __init__(self, end, limit=366, start=None):
+        self.start = start
+        self.end = end
+        self.limit = limit
+
+    def timestamps(self, event, exceptions):
+        """Returns the timestamps of the instances of event, one per line, None to keep the diary sexp"""
+        if event.rule is None:
+            return _org_active(event.start, event.end)
+
+        rule = _compile_rule(event.rule)
+        if rule.end(event.start) is None:
+            return None
+
+        start = event.start
+        if not event.all_day:
+            tzinfo = start.tzinfo
+            naive = start.replace(tzinfo=None)
+        else:
+            tzinfo = None
+            naive = datetime(start.year, start.month, start.day)
+
+        until = None if rule.until is None else _naive_until(rule.until, naive if tzinfo is None else start)
+        recurrence = rule.recurrence(naive, until)
+        if self.start is not None and self.start > naive.date():
+            # Skips the instances before the window in one go, one day early to allow for the timezone shift
+            skip = datetime(self.start.year, self.start.month, self.start.day) - timedelta(days=1)
+            recurrence = recurrence.xafter(max(naive, skip), inc=True)
+
+        excluded = set(_day_key(d, tzinfo) for d in chain(event.exdates, exceptions))
+        duration = event.end - event.start
+        stamps = list()
+
+        for instance in recurrence:
+            if (instance.year, instance.month, instance.day) in excluded:
+                continue
+
+            instance = instance.date() if event.all_day else _localize(instance, tzinfo)
+            if _local_date(instance) > self.end:
+                return None
+
+            last = instance + duration
+            if event.all_day:
+                last -= timedelta(days=1)
+            if self.start is not None and _local_date(last) < self.start:
+                continue
+
+            if len(stamps) == self.limit:
+                return None
+            stamps.append(_org_active(instance, instance + duration))
+
+        return "\n".join(stamps) if stamps else None
+
+    def __repr__(self):
+        return "Expansion({}, {}, {})".format(self.end, self.limit, self.start)
+
+
+def _index_series(events):
+    """Returns an ordered mapping from UID to Series, in order of first appearance"""
+    index = OrderedDict()
+    for event in events:
+        series = index.get(event.uid)
+        if series is None:
+            series = index[event.uid] = Series(event.uid)
+        series.add(event)
+
+    return index
+
+
+def _start_key(series):
+    """Sort key placing series by the start of their first event, all day events at midnight UTC"""
+    start = series.first().start
+    if not isinstance(start, datetime):
+        return datetime(start.year, start.month, start.day)
+    if start.tzinfo is not None:
+        from dateutil import tz
+        return start.astimezone(tz.tzutc()).replace(tzinfo=None)
+    return start
+
+
+# Prefixes of the output lines that change on every run, left out when looking for changes
+VOLATILE_LINES = (b"#+PROPERTY: CREATED ",)
+
+SORT_KEYS = OrderedDict([('input', None),
+                         ('uid', attrgetter('uid')),
+                         ('start', _start_key)])
+
+
+class _NoStage(object):
+    """Stand in for Stats.stage when no statistics are collected"""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NO_STAGE = _NoStage()
+
+
+def _stage(stats, name):
+    """Returns stats.stage(name), or a context doing nothing if stats is None"""
+    return _NO_STAGE if stats is None else stats.stage(name)
 
 
 class Calendar(object):
     """
 
     """
-    __file_template__ = Template("${header}${body}")
     __header_template__ = Template("# -*- buffer-read-only: t -*-\n${properties}\n\n")
     __header_property_template = Template("#+PROPERTY: ${name} ${value}")
 
-    def __init__(self, stream):
-        self._cal = iCal.from_ical(stream.read())
-        self._events = sorted([Event(**e) for e in self._cal.walk("VEVENT")])
+    # Memory held by a parsed event besides its text, and in addition by a recurrence rule and each of its
+    # excluded dates, measured with tracemalloc on the benchmark calendars
+    _EVENT_BYTES = 800
+    _RULE_BYTES = 2000
+    _EXDATE_BYTES = 64
+
+    def __init__(self, stream, sort='input', window=None, expansion=None, stats=None):
+        self._properties = dict()
+        self._stats = stats
+        blocks = list()
+        with _stage(stats, 'read'):
+            buffer = _input_buffer(stream)
+            self._input_bytes = len(buffer)
+            try:
+                self._read(buffer, blocks)
+            finally:
+                if isinstance(buffer, mmap.mmap):
+                    buffer.close()
+
+        # Parsed once all timezones are registered, whatever their position in the calendar
+        with _stage(stats, 'parse'):
+            self._events = [Event.from_component(_parse_ical(text)) for text in blocks]
+        with _stage(stats, 'group'):
+            self._series = _index_series(self._events)
+        self._sort = SORT_KEYS[sort]
+        self._window = window
+        self._expansion = expansion
+        self._pruned = 0
+
+    def _read(self, buffer, blocks):
+        """Reads the calendar properties and timezones, adding the text of every VEVENT to blocks"""
+        for name, lines, _, _ in _iter_blocks(buffer, _CALENDAR_BLOCKS):
+            if name is None:
+                key, _, value = _content_line_parts(lines[0])
+                self._properties.setdefault(key.upper(), value)
+            elif name == 'VTIMEZONE':
+                _parse_ical("\r\n".join(lines))  # Registers the timezone for the events
+            elif name == 'VEVENT':
+                blocks.append(_event_text(lines))
 
     def _get_header(self):
         created = _org_timestamp(datetime.now())
-        props = [self.__header_property_template.substitute(dict(name='PRODID', value=self._cal['PRODID'])),
-                 self.__header_property_template.substitute(dict(name="VERSION", value=self._cal['VERSION'])),
+        props = [self.__header_property_template.substitute(dict(name='PRODID', value=self._properties['PRODID'])),
+                 self.__header_property_template.substitute(dict(name="VERSION", value=self._properties['VERSION'])),
                  self.__header_property_template.substitute(dict(name="CREATED", value=created))]
 
         return self.__header_template__.substitute(dict(properties="\n".join(props)))
 
-    def _get_events(self):
-        _events = list()
-        for key, group in groupby(self._events, attrgetter('UID')):
-            groups = list(group)
-            exceptions = [exception for exception in groups if hasattr(exception, 'RECURRENCE-ID')]
-            for event in groups:
-                _events.append(event.to_org(exceptions))
+    def _iter_entries(self):
+        """Yields the start, whether it recurs and the org entry of every event in the output"""
+        ordered = self._series.values()
+        if self._sort is not None:
+            with _stage(self._stats, 'sort'):
+                ordered = sorted(ordered, key=self._sort)
+
+        for series in ordered:
+            excluded = series.excluded()
+            for event in series:
+                if self._window is None or self._window.contains(event):
+                    yield event.start, event.is_recurring(), event.to_org(excluded, self._expansion)
+                else:
+                    self._pruned += 1
+
+    def _iter_events(self):
+        for _, _, entry in self._iter_entries():
+            yield entry
+
+    def with_options(self, sort='input', window=None, expansion=None):
+        """Returns a calendar sharing the parsed events of this one, rendered with other options"""
+        calendar = copy.copy(self)
+        calendar._sort = SORT_KEYS[sort]
+        calendar._window = window
+        calendar._expansion = expansion
+        calendar._pruned = 0
+        return calendar
+
+    def name(self):
+        """Returns the X-WR-CALNAME of the calendar, None if it has none"""
+        name = self._properties.get('X-WR-CALNAME')
+        return None if name is None else str(name)
 
-        return "\n".join(_events)
+    def _get_events(self):
+        return "\n".join(self._iter_events())
+
+    def statistics(self):
+        """Returns the number of events, series, recurring events, exceptions and events per FREQ"""
+        frequencies = Counter(e.rule['FREQ'][0] for e in self._events if e.rule is not None)
+        return dict(input_bytes=self._input_bytes,
+                    events=len(self._events),
+                    series=len(self._series),
+                    recurring=sum(frequencies.values()),
+                    exceptions=sum(1 for e in self._events if e.recurrence_id is not None),
+                    pruned=self._pruned,
+                    frequencies=dict(frequencies))
+
+    def memory_estimate(self):
+        """Returns an estimate of the memory held by the parsed events, two to five times the size of the input"""
+        size = 0
+        for event in self._events:
+            text = (event.summary, event.description, event.location)
+            size += self._EVENT_BYTES + sum(len(value) for value in text if value)
+            if event.rule is not None:
+                size += self._RULE_BYTES + self._EXDATE_BYTES * len(event.exdates)
+        return size
+
+    def iter_org(self):
+        """Yields the org representation of the calendar in chunks, the header first and then each event"""
+        yield self._get_header()
+        for i, event in enumerate(self._iter_events()):
+            if i:
+                yield "\n"
+            yield event
+
+    def write(self, out):
+        """Writes the org representation of the calendar to out as it is rendered"""
+        out.writelines(_buffered(self.iter_org()))
 
     def __str__(self):
-        return self.__file_template__.substitute(dict(header=self._get_header(), body=self._get_events()))
+        return "".join(self.iter_org())
 
     def __repr__(self):
         return "Calendar ({} Events)".format(len(self._events))
 
 
-def _run_convert(_in, _out):
-    _out.write(str(Calendar(_in)))
+class StreamingCalendar(Calendar):
+    """
+    Calendar that renders one event at a time
+
+    The input is read twice, first to index the overridden instances of each series and register the
+    timezones and then to render the events in input order. Only the index is kept in memory, making
+    memory usage independent of the size of the calendar.
+
+    When given a FragmentCache, series whose content did not change since the cache was written
+    are not parsed at all, their events are taken from the cache instead.
+    """
+
+    _INDEX_PROPERTIES = ('UID', 'RECURRENCE-ID', 'SEQUENCE', 'LAST-MODIFIED', 'RRULE')
+    _INDEX_BLOCKS = {'VEVENT': _INDEX_PROPERTIES, 'VTIMEZONE': None}
+    _CACHE_INDEX_BLOCKS = {'VEVENT': _CALENDAR_BLOCKS['VEVENT'], 'VTIMEZONE': None}
+    _RENDER_BLOCKS = {'VEVENT': _CALENDAR_BLOCKS['VEVENT']}
+
+    def __init__(self, stream, cache=None, window=None, expansion=None, stats=None):
+        self._stats = stats
+        with _stage(stats, 'read'):
+            self._buffer = _input_buffer(stream, spool=True)
+        self._cache = cache
+        self._window = window
+        self._expansion = expansion
+        self._pruned = 0
+        self._properties = dict()
+        self._overrides = defaultdict(list)
+        self._keys = dict()
+        self._count = 0
+        self._series = set()
+        self._frequencies = Counter()
+        with _stage(stats, 'index'):
+            self._index()
+
+    def _index(self):
+        import hashlib
+        from icalendar.prop import vDDDTypes
+
+        digests = dict()
+        timezones = hashlib.sha1()
+
+        # With a cache the events are keyed on the properties that are rendered, so that volatile ones
+        # like DTSTAMP, set to the export time by most servers, do not make every series look changed
+        blocks = self._INDEX_BLOCKS if self._cache is None else self._CACHE_INDEX_BLOCKS
+        for name, lines, _, _ in _iter_blocks(self._buffer, blocks):
+            if name is None:
+                key, _, value = _content_line_parts(lines[0])
+                self._properties.setdefault(key.upper(), value)
+            elif name == 'VTIMEZONE':
+                _parse_ical("\r\n".join(lines))  # Registers the timezone before any event is rendered
+                timezones.update("\n".join(lines).encode('utf8'))
+            elif name == 'VEVENT':
+                self._count += 1
+                props = _block_properties(lines, self._INDEX_PROPERTIES)
+                uid = props.get('UID')
+                self._series.add(uid)
+                if 'RECURRENCE-ID' in props:
+                    self._overrides[uid].append(vDDDTypes.from_ical(props['RECURRENCE-ID']))
+                if 'RRULE' in props:
+                    self._frequencies[_rule_frequency(props['RRULE'])] += 1
+
+                if self._cache is not None:
+                    digest = digests.setdefault(uid, [hashlib.sha1(), 0, ""])
+                    digest[0].update("\n".join(lines).encode('utf8'))
+                    digest[1] = max(digest[1], int(props.get('SEQUENCE', 0)))
+                    digest[2] = max(digest[2], props.get('LAST-MODIFIED', ""))
+
+        for uid, (content, sequence, modified) in digests.items():
+            content.update(timezones.digest())
+            self._keys[uid] = "{}:{}:{}".format(sequence, modified, content.hexdigest())
+
+    def _render(self, uid, lines):
+        """Returns the org entry of an event, or an empty string if it is outside the window"""
+        with _stage(self._stats, 'parse'):
+            event = Event.from_component(_parse_ical(_event_text(lines)))
+        if self._window is not None and not self._window.contains(event):
+            return ""
+        return event.to_org(self._overrides.get(uid, ()), self._expansion)
+
+    def _iter_rendered(self):
+        """Yields the lines and org entry of every VEVENT, the entry is empty if the event is left out"""
+        positions = defaultdict(int)
+
+        for name, lines, _, _ in _iter_blocks(self._buffer, self._RENDER_BLOCKS):
+            if name == 'VEVENT':
+                uid = _block_properties(lines, ('UID',)).get('UID')
+                if self._cache is None:
+                    fragment = self._render(uid, lines)
+                else:
+                    key = self._keys[uid]
+                    position = positions[uid]
+                    positions[uid] += 1
+
+                    fragment = self._cache.get(uid, key, position)
+                    if fragment is None:
+                        fragment = self._render(uid, lines)
+                    self._cache.put(uid, key, position, fragment)
+
+                if not fragment:
+                    self._pruned += 1
+                yield lines, fragment
+
+    def _iter_events(self):
+        for _, fragment in self._iter_rendered():
+            if fragment:
+                yield fragment
+
+    def _iter_entries(self):
+        from icalendar.prop import vDDDTypes
+
+        for lines, fragment in self._iter_rendered():
+            if not fragment:
+                continue
+
+            start, recurring = None, False
+            for line in lines:
+                upper = line[:8].upper()
+                if start is None and upper.startswith("DTSTART") and upper[7] in ";:":
+                    _, params, value = _content_line_parts(line)
+                    start = vDDDTypes.from_ical(value, timezone=params.get('TZID'))
+                elif upper.startswith("RRULE") and upper[5] in ";:":
+                    recurring = True
+            yield start, recurring, fragment
+
+    def statistics(self):
+        return dict(input_bytes=len(self._buffer),
+                    events=self._count,
+                    series=len(self._series),
+                    recurring=sum(self._frequencies.values()),
+                    exceptions=sum(len(overrides) for overrides in self._overrides.values()),
+                    pruned=self._pruned,
+                    frequencies=dict(self._frequencies))
+
+    def __repr__(self):
+        return "Calendar ({} Events)".format(self._count)
+
+
+def _input_name(stream):
+    """Returns the file name of the input, or the last part of the path of a feed, without extension"""
+    if isinstance(stream, str):
+        from urllib.parse import urlsplit
+        return os.path.splitext(os.path.basename(urlsplit(stream).path))[0] or None
+
+    name = getattr(stream, 'name', None)
+    if not isinstance(name, str) or name.startswith('<'):
+        return None  # stdin
+    return os.path.splitext(os.path.basename(name))[0]
+
+
+def _open_calendar(_in, stream, cache, sort, window, expansion, stats=None):
+    if stream or cache is not None:
+        return StreamingCalendar(_in, cache=cache, window=window, expansion=expansion, stats=stats)
+    return Calendar(_in, sort=sort, window=window, expansion=expansion, stats=stats)
+
+
+def _cache_context(window, expansion=None):
+    """Returns the settings affecting the rendered fragments, besides the event data"""
+    return "{} {!r} {!r}".format(timezone_name(), window, expansion)
+
+
+def _run_convert(_in, _out, stream=False, cache=None, stats=None, sort='input', timezone=None, window=None,
+                 expansion=None):
+    set_timezone(timezone)
+    if cache is not None and not isinstance(cache, FragmentCache):
+        cache = FragmentCache(cache, context=_cache_context(window, expansion))
+
+    if stats is None:
+        calendar = _open_calendar(_in, stream, cache, sort, window, expansion)
+        calendar.write(_out)
+    else:
+        with stats.total():
+            calendar = _open_calendar(_in, stream, cache, sort, window, expansion, stats)
+            stats.writer(_out).writelines(_buffered(stats.timed('render', calendar.iter_org())))
+
+        stats.update(calendar.statistics())
+        if cache is not None:
+            stats.update(dict(cache_hits=cache.hits, cache_misses=cache.misses))
+
+    if cache is not None:
+        cache.save()
+
+
+@contextmanager
+def _open_output(path, keep_unchanged=False):
+    """
+    Opens the output, replacing files atomically so readers never see a partially written file
+
+    With keep_unchanged, files are left untouched if nothing but the CREATED time in the header changed.
+    """
+    if path == '-':
+        yield sys.stdout
+    else:
+        with atomic_write(path, volatile=VOLATILE_LINES if keep_unchanged else None) as stream:
+            yield stream
+
+
+def _run_watch(input_path, output_path, interval=1.0, cache=None, timezone=None, from_date=None, to_date=None,
+               expand=False, expand_horizon=365, expand_limit=366, keep_unchanged=False, runs=None, **options):
+    """
+    Converts input_path to output_path every time the input changes
+
+    The rendered series are kept in memory between conversions, so only the series that changed are
+    parsed again. Conversion errors are reported on stderr and the input is watched for the next change.
+    Dates relative to today and the expansion horizon are resolved again for every conversion, so that
+    the window moves along while the watch keeps running.
+    """
+    set_timezone(timezone)
+    path, cache, context = cache, None, None
+    changes = watcher([input_path], interval)
+
+    try:
+        while True:
+            window = _window(from_date, to_date)
+            expansion = _expansion(expand, expand_horizon, expand_limit, window)
+            current = _cache_context(window, expansion)
+            if current != context:
+                context = current
+                cache = FragmentCache(path, context=context)
+            try:
+                _in = _read_file(input_path)
+                with _open_output(output_path, keep_unchanged) as _out:
+                    _run_convert(_in, _out, cache=cache, timezone=timezone, window=window, expansion=expansion,
+                                 **options)
+            except Exception as e:
+                cache.discard()
+                sys.stderr.write("{}: {}: {}\n".format(input_path, type(e).__name__, e))
+
+            if runs is not None:
+                runs -= 1
+                if runs <= 0:
+                    return
+            changes.wait()
+    finally:
+        changes.close()
+
+
+def _timezone_argument(name):
+    from dateutil import tz
+
+    if tz.gettz(name) is None:
+        raise argparse.ArgumentTypeError("unknown timezone: {}".format(name))
+    return name
+
+
+def _input_argument(value):
+    """Returns URLs of feeds as is and opens everything else as a binary file, - being stdin"""
+    if is_url(value):
+        return value
+    return argparse.FileType(mode='rb')(value)
+
+
+def _date_argument(value):
+    """Parses a YYYY-MM-DD date, or a number of days relative to today like -30 or 90 as a timedelta"""
+    try:
+        return timedelta(days=int(value))
+    except ValueError:
+        pass
+
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected YYYY-MM-DD or a number of days: {}".format(value))
+
+
+def _resolve_date(value):
+    """Returns a date, or today moved by a timedelta from _date_argument"""
+    return date.today() + value if isinstance(value, timedelta) else value
+
+
+def _window(start, end):
+    """Returns the Window between start and end, dates or timedeltas from today, None if both are None"""
+    return None if start is None and end is None else Window(_resolve_date(start), _resolve_date(end))
+
+
+def _expansion(expand, horizon, limit, window):
+    """Returns the Expansion for --expand, up to the end of the window or horizon days from today"""
+    if not expand:
+        return None
+    if window is not None and window.end is not None:
+        end = window.end
+    else:
+        end = date.today() + timedelta(days=horizon)
+    return Expansion(end, limit, None if window is None else window.start)
+
+
+def _count_argument(value):
+    try:
+        count = int(value)
+    except ValueError:
+        count = -1
+    if count < 0:
+        raise argparse.ArgumentTypeError("expected a number of zero or more: {}".format(value))
+    return count
+
+
+def _fetch_feed(url, output, feeds, timeout, context):
+    """Returns the Feed at url, conditionally requested if output was written from it with the same context"""
+    from ical2org.fetch import Fetcher
+
+    fetcher = Fetcher(timeout)
+    try:
+        return fetcher.fetch(url, None if output is None else feeds.validators(url, output, context))
+    finally:
+        fetcher.close()
+
+
+def _write_stats(stats, path):
+    if path == '-':
+        stats.dump(sys.stderr)
+    else:
+        with open(path, 'w', encoding='utf8') as stream:
+            stats.dump(stream)
+
+
+def _add_conversion_arguments(parser):
+    """Adds the options shared by ical2org2 and ical2org2-batch that control reading and rendering"""
+    parser.add_argument('--stream', action='store_true',
+                        help="Convert one event at a time, keeping memory usage flat for large calendars")
+    parser.add_argument('--timezone', metavar='NAME', type=_timezone_argument, default=None,
+                        help="Timezone to show events in, like Europe/Paris, the local timezone by default")
+    parser.add_argument('--from', metavar='DATE', dest='from_date', type=_date_argument, default=None,
+                        help="Leave out events ending before DATE, YYYY-MM-DD or days from today like -30")
+    parser.add_argument('--to', metavar='DATE', dest='to_date', type=_date_argument, default=None,
+                        help="Leave out events starting after DATE, YYYY-MM-DD or days from today like 365")
+    parser.add_argument('--expand', action='store_true',
+                        help="Write recurring events as one timestamp per instance, which org-agenda shows faster")
+    parser.add_argument('--expand-horizon', metavar='DAYS', type=_count_argument, default=365,
+                        help="Only expand series ending within DAYS from today, or --to if given, 365 by default")
+    parser.add_argument('--expand-limit', metavar='COUNT', type=_count_argument, default=366,
+                        help="Keep series with more than COUNT instances as diary sexps, 366 by default")
+    parser.add_argument('--keep-unchanged', action='store_true',
+                        help="Leave output files untouched if nothing but their CREATED time would change")
+    parser.add_argument('--feed-cache', metavar='PATH', default=None,
+                        help="Remember the ETag and Last-Modified of URL inputs in PATH and skip the conversion "
+                             "of feeds that did not change")
+    parser.add_argument('--timeout', metavar='SECONDS', type=float, default=30.0,
+                        help="Timeout for fetching URL inputs, 30 seconds by default")
+
+
+def _parsed_window(parser, settings):
+    """Returns the Window of the --from and --to options, exiting with a usage error if --from is after --to"""
+    window = _window(settings['from_date'], settings['to_date'])
+    if window is not None and window.start is not None and window.end is not None and window.start > window.end:
+        parser.error("--from must not be after --to")
+    return window
 
 
 def convert(args):
     parser = argparse.ArgumentParser(description=__description__)
     parser.add_argument('--version', action='version', version='%(prog)s {}'.format(version()))
-    parser.add_argument('--input', type=argparse.FileType(mode='r', encoding='utf8'), default=sys.stdin)
-    parser.add_argument('--output', type=argparse.FileType(mode='w', encoding='utf8'), default=sys.stdout)
+    parser.add_argument('--input', metavar='PATH', type=_input_argument, default=None,
+                        help="File or http(s) URL of the calendar to convert, stdin by default")
+    parser.add_argument('--output', metavar='PATH', default='-',
+                        help="File to write, replaced atomically, stdout by default, the directory with --shard")
+    parser.add_argument('--shard', choices=['month', 'kind', 'calendar'], default=None,
+                        help="Write one org file per month of DTSTART, for recurring and single events or named "
+                             "after the calendar to the --output directory, with an agenda-files manifest")
+    parser.add_argument('--cache', metavar='PATH', default=None,
+                        help="Reuse the output for series unchanged since the last run (implies --stream)")
+    _add_conversion_arguments(parser)
+    parser.add_argument('--sort', choices=list(SORT_KEYS), default='input',
+                        help="Order of the series in the output, input order by default")
+    parser.add_argument('--stats', metavar='PATH', nargs='?', const='-', default=None,
+                        help="Write timings and counters as JSON to PATH, or stderr if no PATH is given")
+    parser.add_argument('--profile', metavar='PATH', default=None,
+                        help="Write a cProfile dump of the conversion to PATH")
+    parser.add_argument('--watch', action='store_true',
+                        help="Keep running and convert again whenever the input changes (implies --stream)")
+    parser.add_argument('--poll-interval', metavar='SECONDS', type=float, default=1.0,
+                        help="How often to check the input with --watch where inotify is not available")
 
     settings = vars(parser.parse_args(args[1:]))
-    _run_convert(settings['input'], settings['output'])
+    if settings['sort'] != 'input' and (settings['stream'] or settings['cache'] or settings['watch']):
+        parser.error("--sort requires the whole calendar in memory and can not be combined with --stream, "
+                     "--cache or --watch")
+
+    window = _parsed_window(parser, settings)
+    expansion = _expansion(settings['expand'], settings['expand_horizon'], settings['expand_limit'], window)
+
+    if settings['shard']:
+        if settings['output'] == '-':
+            parser.error("--shard requires an --output directory")
+        if settings['watch'] or settings['stats']:
+            parser.error("--shard can not be combined with --watch or --stats")
+
+    if settings['watch']:
+        if _input_name(settings['input']) is None or isinstance(settings['input'], str) or settings['output'] == '-':
+            parser.error("--watch requires both --input and --output files")
+        if settings['stats'] or settings['profile']:
+            parser.error("--watch can not be combined with --stats or --profile")
+
+        settings['input'].close()
+        return _run_watch(settings['input'].name, settings['output'], interval=settings['poll_interval'],
+                          cache=settings['cache'], timezone=settings['timezone'], from_date=settings['from_date'],
+                          to_date=settings['to_date'], expand=settings['expand'],
+                          expand_horizon=settings['expand_horizon'], expand_limit=settings['expand_limit'],
+                          keep_unchanged=settings['keep_unchanged'])
+
+    if settings['input'] is None:
+        settings['input'] = getattr(sys.stdin, 'buffer', sys.stdin)
+    name = _input_name(settings['input'])
+    feed = None
+    if isinstance(settings['input'], str):
+        from ical2org.fetch import FeedCache
+
+        set_timezone(settings['timezone'])
+        feeds = FeedCache(settings['feed_cache'])
+        output = None if settings['output'] == '-' else os.path.abspath(settings['output'])
+        context = "{} {} {}".format(_cache_context(window, expansion), settings['sort'], settings['shard'])
+        try:
+            feed = _fetch_feed(settings['input'], output, feeds, settings['timeout'], context)
+        except Exception as e:
+            sys.stderr.write("{}: {}: {}\n".format(settings['input'], type(e).__name__, e))
+            return 1
+
+        if feed.status == 304:
+            return None
+        settings['input'] = feed.body
+
+    stats = Stats() if settings['stats'] else None
+    profile = None
+    if settings['profile']:
+        import cProfile
+        profile = cProfile.Profile()
+
+    if profile is not None:
+        profile.enable()
+    try:
+        if settings['shard']:
+            from ical2org.shards import run_shards
+            try:
+                run_shards(settings['input'], settings['output'], settings['shard'], stream=settings['stream'],
+                           cache=settings['cache'], sort=settings['sort'], timezone=settings['timezone'],
+                           window=window, expansion=expansion, name=name)
+            except ValueError as e:
+                sys.stderr.write("{}\n".format(e))
+                return 1
+        else:
+            with _open_output(settings['output'], settings['keep_unchanged']) as _out:
+                _run_convert(settings['input'], _out, stream=settings['stream'], cache=settings['cache'],
+                             stats=stats, sort=settings['sort'], timezone=settings['timezone'], window=window,
+                             expansion=expansion)
+    finally:
+        if profile is not None:
+            profile.disable()
+            profile.dump_stats(settings['profile'])
+
+    if stats is not None:
+        _write_stats(stats, settings['stats'])
+
+    if feed is not None and output is not None:
+        feeds.put(feed, output, context)
+        feeds.save()
 
 
 def main():
@@ -0,0 +1,313 @@
+# -*- coding: utf-8 -*-
+# MIT License
+
+# Copyright (c) 2019 Björn Larsson
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Conversion server on a Unix domain socket, keeping parsed calendars and rendered output in memory
+
+Each request is a line of JSON followed by the ics data, each response a line of JSON followed by the
+org output. Requests name the length of the data, or a path for the server to read instead, and the
+rendering options:
+
+    {"length": 1234, "options": {"timezone": "Europe/Paris", "from": "2019-01-01"}}
+    {"path": "/home/me/calendar.ics", "length": 0, "options": {}}
+
+Responses carry the length of the output, which cache it came from, if any, or an error:
+
+    {"ok": true, "length": 5678, "cached": "calendar"}
+    {"ok": false, "error": "KeyError: 'DTSTART'"}
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import signal
+import socket
+import socketserver
+import stat
+import sys
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+
+from ical2org.ical2org import (Calendar, SORT_KEYS, sigint_handler, _cache_context, _expansion, _window,
+                               set_timezone)
+from ical2org.version import version
+
+__description__ = "Serves icalendar to org-agenda conversions on a Unix domain socket"
+
+
+class ConversionCache(object):
+    """
+    Least recently used parsed calendars and rendered output, up to max_bytes in total
+
+    Items are counted by the size given when they are put, an estimate of the memory they hold. Items
+    larger than max_bytes on their own are not kept.
+    """
+
+    def __init__(self, max_bytes=256 << 20):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+
+    def get(self, key):
+        item = self._items.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._items.move_to_end(key)
+        return item[0]
+
+    def put(self, key, value, size):
+        if key in self._items:
+            self.size -= self._items.pop(key)[1]
+        if size > self.max_bytes:
+            return
+
+        self._items[key] = (value, size)
+        self.size += size
+        while self.size > self.max_bytes:
+            _, (_, evicted) = self._items.popitem(last=False)
+            self.size -= evicted
+
+    def __len__(self):
+        return len(self._items)
+
+
+def _option_date(value):
+    return None if value is None else datetime.strptime(value, "%Y-%m-%d").date()
+
+
+class ConversionService(object):
+    """
+    Converts calendars with the parsed calendar and output of identical requests taken from a cache
+
+    Calendars are keyed by the SHA-1 of their content, output also by the options it was rendered with.
+    Conversions are serialized, since the target timezone is global state.
+    """
+
+    def __init__(self, max_bytes=256 << 20):
+        self.cache = ConversionCache(max_bytes)
+        self._lock = threading.Lock()
+
+    def convert(self, data, options=None):
+        """Returns the org output for the ics data and from which cache it came, 'output', 'calendar' or None"""
+        options = options or dict()
+        sort = options.get('sort', 'input')
+        if sort not in SORT_KEYS:
+            raise ValueError("Unknown sort order: {}".format(sort))
+
+        window = _window(_option_date(options.get('from')), _option_date(options.get('to')))
+        expansion = _expansion(options.get('expand', False), options.get('expand_horizon', 365),
+                               options.get('expand_limit', 366), window)
+        digest = hashlib.sha1(data).hexdigest()
+
+        with self._lock:
+            set_timezone(options.get('timezone'))
+            key = ('output', digest, "{} {}".format(_cache_context(window, expansion), sort))
+            output = self.cache.get(key)
+            if output is not None:
+                return output, 'output'
+
+            cached = 'calendar'
+            calendar = self.cache.get(('calendar', digest))
+            if calendar is None:
+                cached = None
+                calendar = Calendar(data)
+                self.cache.put(('calendar', digest), calendar, calendar.memory_estimate())
+
+            output = "".join(calendar.with_options(sort, window, expansion).iter_org())
+            self.cache.put(key, output, sys.getsizeof(output))
+            return output, cached
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            header = self.rfile.readline()
+            if not header:
+                return
+
+            try:
+                request = json.loads(header.decode('utf8'))
+                data = self.rfile.read(int(request.get('length', 0)))
+                if request.get('path'):
+                    with open(request['path'], 'rb') as stream:
+                        data = stream.read()
+                output, cached = self.server.service.convert(data, request.get('options'))
+            except Exception as e:
+                self._respond(dict(ok=False, error="{}: {}".format(type(e).__name__, e)))
+            else:
+                body = output.encode('utf8')
+                self._respond(dict(ok=True, length=len(body), cached=cached), body)
+
+    def _respond(self, response, body=b""):
+        self.wfile.write(json.dumps(response).encode('utf8') + b"\n" + body)
+        self.wfile.flush()
+
+
+class ConversionServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Unix domain socket server for a ConversionService, only accessible to the user running it
+    """
+    daemon_threads = True
+
+    def __init__(self, path, service=None):
+        try:
+            if stat.S_ISSOCK(os.stat(path).st_mode):
+                os.unlink(path)  # Left behind by an earlier server
+        except OSError:
+            pass
+
+        self.service = service or ConversionService()
+        socketserver.UnixStreamServer.__init__(self, path, _Handler, bind_and_activate=False)
+        try:
+            self.server_bind()
+            os.chmod(path, 0o600)
+            self.server_activate()
+        except BaseException:
+            self.server_close()
+            raise
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        try:
+            os.unlink(self.server_address)
+        except OSError:
+            pass
+
+
+class Client(object):
+    """
+    Connection to a conversion server, kept open between requests
+    """
+
+    def __init__(self, path, timeout=None):
+        self._path = path
+        self._timeout = timeout
+        self._socket = None
+        self._stream = None
+
+    def _connect(self):
+        if self._socket is None:
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._socket.settimeout(self._timeout)
+            self._socket.connect(self._path)
+            self._stream = self._socket.makefile('rwb')
+
+    def convert(self, data=None, path=None, timezone=None, sort='input', from_date=None, to_date=None,
+                expand=False, expand_horizon=365, expand_limit=366):
+        """
+        Returns the org output of the ics data, or of the file at path as read by the server
+
+        The options are those of the ical2org2 command, from_date and to_date being dates.
+        Raises ValueError if the server could not convert the calendar.
+        """
+        if (data is None) == (path is None):
+            raise ValueError("Expected either data or a path")
+
+        options = dict(timezone=timezone, sort=sort, expand=expand, expand_horizon=expand_horizon,
+                       expand_limit=expand_limit)
+        for name, value in (('from', from_date), ('to', to_date)):
+            if value is not None:
+                options[name] = value.isoformat() if isinstance(value, date) else value
+
+        data = data or b""
+        if isinstance(data, str):
+            data = data.encode('utf8')
+        request = dict(length=len(data), options=options)
+        if path is not None:
+            request['path'] = os.path.abspath(path)
+
+        self._connect()
+        try:
+            self._stream.write(json.dumps(request).encode('utf8') + b"\n" + data)
+            self._stream.flush()
+            header = self._stream.readline()
+            if not header:
+                raise IOError("Connection closed by the conversion server")
+            response = json.loads(header.decode('utf8'))
+            body = self._stream.read(response.get('length', 0))
+        except BaseException:
+            self.close()
+            raise
+
+        if not response.get('ok'):
+            raise ValueError(response.get('error'))
+        return body.decode('utf8')
+
+    def close(self):
+        if self._socket is not None:
+            self._stream.close()
+            self._socket.close()
+            self._socket = None
+            self._stream = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+def convert_remote(socket_path, data=None, path=None, **options):
+    """Converts a calendar with the server listening on socket_path, see Client.convert"""
+    with Client(socket_path) as client:
+        return client.convert(data, path, **options)
+
+
+def serve(args):
+    parser = argparse.ArgumentParser(description=__description__)
+    parser.add_argument('--version', action='version', version='%(prog)s {}'.format(version()))
+    parser.add_argument('--socket', metavar='PATH', required=True, help="Unix domain socket to listen on")
+    parser.add_argument('--memory', metavar='MB', type=int, default=256,
+                        help="Memory for cached calendars and output, 256 MB by default")
+
+    settings = vars(parser.parse_args(args[1:]))
+    if settings['memory'] < 0:
+        parser.error("--memory must not be negative")
+
+    # Imported up front so that the first request does not pay for it
+    import icalendar  # noqa: F401
+    import dateutil.rrule  # noqa: F401
+    set_timezone()
+
+    server = ConversionServer(settings['socket'], ConversionService(settings['memory'] << 20))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+def main():
+    signal.signal(signal.SIGINT, sigint_handler)
+    signal.signal(signal.SIGTERM, sigint_handler)
+    return serve(sys.argv)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+# MIT License
+
+# Copyright (c) 2019 Björn Larsson
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Writes a calendar as several org files, with a manifest listing them for org-agenda-files
+"""
+
+import io
+import os
+import re
+from collections import OrderedDict
+
+from ical2org.atomic import atomic_write, file_digest, lines_digest
+from ical2org.cache import FragmentCache
+from ical2org.ical2org import VOLATILE_LINES, _cache_context, _local_date, _open_calendar, set_timezone
+
+MANIFEST = 'agenda-files'
+
+_SHARD_NAME = re.compile(r"[\w.-]+\.org\Z")
+_SHARD_HEADER = ("# -*- buffer-read-only: t -*-\n", "#+PROPERTY: PRODID ")
+
+
+def _month_shard(start, recurring):
+    day = _local_date(start)
+    return "{:04d}-{:02d}".format(day.year, day.month)
+
+
+def _kind_shard(start, recurring):
+    return "recurring" if recurring else "single"
+
+
+SHARD_KEYS = OrderedDict([('month', _month_shard),
+                          ('kind', _kind_shard),
+                          ('calendar', None)])
+
+
+def _file_name(name):
+    """Returns name with everything but letters, digits, dots and dashes replaced, for use as a file name"""
+    return re.sub(r"[^\w.-]+", "-", name).strip("-.") or "calendar"
+
+
+def _unchanged(path, content):
+    """Returns whether the file at path has content, not counting the CREATED time in the header"""
+    return file_digest(path, VOLATILE_LINES) == lines_digest(io.BytesIO(content.encode('utf8')), VOLATILE_LINES)
+
+
+def _replace(path, content):
+    """Atomically writes content to path unless it is already there, returns whether the file was written"""
+    if _unchanged(path, content):
+        return False
+
+    with atomic_write(path) as stream:
+        stream.write(content)
+    return True
+
+
+def _read_manifest(path):
+    try:
+        with open(path, encoding='utf8') as stream:
+            return [line.rstrip("\n") for line in stream if line.strip()]
+    except (IOError, OSError, UnicodeDecodeError):
+        return None
+
+
+def _is_shard(path, directory, missing=False):
+    """
+    Returns whether path is an org file in directory that starts like the shards written here
+
+    With missing, the name of a shard that no longer exists counts as well.
+    """
+    if os.path.dirname(path) != directory or not _SHARD_NAME.match(os.path.basename(path)):
+        return False
+    if missing and not os.path.lexists(path):
+        return True
+    try:
+        with open(path, encoding='utf8') as stream:
+            return stream.readline() == _SHARD_HEADER[0] and stream.readline().startswith(_SHARD_HEADER[1])
+    except (IOError, OSError, UnicodeDecodeError):
+        return False
+
+
+def _owned_manifest(path, directory):
+    """
+    Returns the paths listed in the manifest at path, an empty list if there is none
+
+    Raises ValueError if the file exists but was not written by write_shards, that is if it lists anything
+    but shards in directory, so that a hand maintained org-agenda-files list is never taken over.
+    """
+    if not os.path.lexists(path):
+        return []
+
+    listed = _read_manifest(path)
+    if listed is None or not all(_is_shard(listed_path, directory, missing=True) for listed_path in listed):
+        raise ValueError("{} was not written by ical2org, refusing to replace it".format(path))
+    return listed
+
+
+def write_shards(calendar, directory, by='month', name=None):
+    """
+    Writes the events of calendar to one org file per shard in directory, returning the paths written or removed
+
+    Events are split by the month of their DTSTART, by whether they recur, or all go to one file named
+    after the calendar. Shards whose content did not change are left untouched, so that Emacs and other
+    watchers only reload what changed. Shards from an earlier run that are now empty are removed.
+    The manifest lists the absolute paths of the shards, one per line, the format org-agenda-files
+    reads when set to a file name. Raises ValueError, before writing anything, if directory holds a
+    manifest or a file named like one of the shards that was not written here.
+    """
+    directory = os.path.abspath(directory)
+    manifest = os.path.join(directory, MANIFEST)
+    previous = _owned_manifest(manifest, directory)
+
+    shard_key = SHARD_KEYS[by]
+    if shard_key is None:
+        shard = _file_name(calendar.name() or name or "calendar")
+
+        def shard_key(start, recurring):
+            return shard
+
+    shards = OrderedDict()
+    for start, recurring, entry in calendar._iter_entries():
+        shards.setdefault(shard_key(start, recurring), list()).append(entry)
+
+    paths = [os.path.join(directory, shard + '.org') for shard in sorted(shards)]
+    for path in paths:
+        if os.path.lexists(path) and not _is_shard(path, directory):
+            raise ValueError("{} was not written by ical2org, refusing to replace it".format(path))
+
+    header = calendar._get_header()
+    written = list()
+    for shard, path in zip(sorted(shards), paths):
+        if _replace(path, header + "\n".join(shards[shard])):
+            written.append(path)
+
+    for stale in set(previous) - set(paths):
+        if not _is_shard(stale, directory):
+            continue
+        try:
+            os.remove(stale)
+        except OSError:
+            pass
+        else:
+            written.append(stale)
+
+    _replace(manifest, "".join(path + "\n" for path in paths))
+    return written
+
+
+def run_shards(_in, directory, by='month', stream=False, cache=None, sort='input', timezone=None, window=None,
+               expansion=None, name=None):
+    """Converts _in to shards in directory, like _run_convert does to a single output"""
+    set_timezone(timezone)
+    if cache is not None and not isinstance(cache, FragmentCache):
+        cache = FragmentCache(cache, context=_cache_context(window, expansion))
+
+    os.makedirs(directory, exist_ok=True)
+    calendar = _open_calendar(_in, stream, cache, sort, window, expansion)
+    written = write_shards(calendar, directory, by, name)
+
+    if cache is not None:
+        cache.save()
+    return written
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+# MIT License
+
+# Copyright (c) 2019 Björn Larsson
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Collection of timings and counters for a conversion run
+"""
+
+import json
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from ical2org.version import version
+
+
+class Stats(object):
+    """
+    Accumulates wall and CPU time per stage and counters describing a conversion
+
+    Stages exclude the time of the stages nested in them, so that they add up to the total. The collected
+    data is written as JSON, meant to be consumed by monitoring rather than read by humans.
+    """
+
+    def __init__(self):
+        self.stages = OrderedDict()
+        self.counts = OrderedDict()
+        self._nested = list()
+
+    def _add(self, name, wall, cpu):
+        stage = self.stages.setdefault(name, [0.0, 0.0])
+        stage[0] += wall
+        stage[1] += cpu
+
+    @contextmanager
+    def stage(self, name):
+        """Adds the time spent in the with block, less that of the stages nested in it, to the named stage"""
+        wall, cpu = time.perf_counter(), time.process_time()
+        self._nested.append([0.0, 0.0])
+        try:
+            yield
+        finally:
+            nested = self._nested.pop()
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            self._add(name, wall - nested[0], cpu - nested[1])
+            if self._nested:
+                self._nested[-1][0] += wall
+                self._nested[-1][1] += cpu
+
+    @contextmanager
+    def total(self):
+        """Records the time spent in the with block, nested stages included, as the total stage"""
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            self._add('total', time.perf_counter() - wall, time.process_time() - cpu)
+
+    def timed(self, name, iterable):
+        """Yields from iterable, adding the time spent producing each item to the named stage"""
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def writer(self, out):
+        """Returns a wrapper of out that times the writes and counts the bytes written"""
+        return _StatsWriter(out, self)
+
+    def update(self, counts):
+        for name, value in counts.items():
+            self.counts[name] = value
+
+    def to_dict(self):
+        stages = OrderedDict((name, dict(wall=wall, cpu=cpu)) for name, (wall, cpu) in self.stages.items())
+        return dict(version=version(), stages=stages, counts=self.counts)
+
+    def dump(self, stream):
+        json.dump(self.to_dict(), stream, sort_keys=True)
+        stream.write("\n")
+
+
+class _StatsWriter(object):
+    def __init__(self, out, stats):
+        self._out = out
+        self._stats = stats
+        self._stats.counts.setdefault('output_bytes', 0)
+
+    def write(self, data):
+        with self._stats.stage('write'):
+            self._out.write(data)
+        self._stats.counts['output_bytes'] += len(data.encode('utf8'))
+
+    def writelines(self, chunks):
+        for chunk in chunks:
+            self.write(chunk)
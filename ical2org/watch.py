@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+# MIT License
+
+# Copyright (c) 2019 Björn Larsson
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Waiting for changes to input files, using inotify where available and polling otherwise
+"""
+
+import os
+import select
+import time
+
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+
+
+def _signature(path):
+    """Returns what identifies a version of a file, None if it does not exist"""
+    try:
+        info = os.stat(path)
+    except OSError:
+        return None
+    return info.st_ino, info.st_size, info.st_mtime_ns
+
+
+class PollingWatcher(object):
+    """
+    Detects changes by comparing the inode, size and modification time of each file every interval seconds
+    """
+
+    def __init__(self, paths, interval=1.0):
+        self._paths = [os.path.abspath(path) for path in paths]
+        self._interval = interval
+        self._signatures = dict((path, _signature(path)) for path in self._paths)
+
+    def _changed(self):
+        changed = list()
+        for path in self._paths:
+            signature = _signature(path)
+            if signature != self._signatures[path]:
+                self._signatures[path] = signature
+                changed.append(path)
+        return changed
+
+    def wait(self, timeout=None):
+        """Blocks until at least one file changed, returning the changed paths, or an empty list on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            changed = self._changed()
+            if changed:
+                return changed
+            if deadline is not None and time.monotonic() >= deadline:
+                return []
+            time.sleep(self._interval if deadline is None else
+                       max(0.0, min(self._interval, deadline - time.monotonic())))
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher(PollingWatcher):
+    """
+    Detects changes through inotify on the directories of the files
+
+    Watching the directories rather than the files catches editors and sync tools that replace files by
+    renaming a new version over them. Any event wakes the watcher up, the file signatures then tell
+    which of the watched files actually changed.
+    """
+
+    def __init__(self, paths, interval=1.0):
+        import ctypes
+        import ctypes.util
+
+        super(InotifyWatcher, self).__init__(paths, interval)
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._fd = libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        mask = _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_ATTRIB
+        try:
+            for directory in set(os.path.dirname(path) for path in self._paths):
+                if libc.inotify_add_watch(self._fd, os.fsencode(directory), mask) < 0:
+                    raise OSError(ctypes.get_errno(), "inotify_add_watch failed for {}".format(directory))
+        except BaseException:
+            os.close(self._fd)
+            raise
+
+    def _drain(self):
+        """Reads all pending events, the signatures of the files tell which of them changed"""
+        while True:
+            try:
+                os.read(self._fd, 65536)
+            except BlockingIOError:
+                return
+
+    def wait(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            changed = self._changed()
+            if changed:
+                return changed
+
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return []
+
+            ready, _, _ = select.select([self._fd], [], [], remaining)
+            if ready:
+                self._drain()
+
+    def close(self):
+        os.close(self._fd)
+
+
+def watcher(paths, interval=1.0):
+    """Returns an inotify based watcher for paths, falling back to polling where inotify is not available"""
+    try:
+        return InotifyWatcher(paths, interval)
+    except (AttributeError, OSError):
+        return PollingWatcher(paths, interval)
@@ -43,12 +43,14 @@ setup(
     long_description="",
     keywords="ical iCalendar calendar org org-mode emacs",
     platforms=["any"],
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmarks']),
     install_requires=['icalendar', 'python-dateutil'],
     tests_require=['libfaketime'],
     entry_points={
         'console_scripts': [
             'ical2org2 = ical2org.ical2org:main',
+            'ical2org2-batch = ical2org.batch:main',
+            'ical2org2-server = ical2org.server:main',
         ],
     },
     python_requires=">=3.4",
@@ -0,0 +1,88 @@
+# MIT License
+
+# Copyright (c) 2019 Björn Larsson
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from contextlib import redirect_stderr
+
+from ical2org.batch import convert_batch, run_batch, _read_manifest
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+
+BROKEN = "BEGIN:VCALENDAR\nPRODID:x\nVERSION:2.0\nBEGIN:VEVENT\nUID:1\nSUMMARY:x\nEND:VEVENT\nEND:VCALENDAR\n"
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.input_dir = os.path.join(self.directory, 'in')
+        self.output_dir = os.path.join(self.directory, 'out')
+        os.mkdir(self.input_dir)
+
+        for name in ('single-event', 'recurring-event'):
+            shutil.copy(os.path.join(DATA_DIR, name + '.input'), os.path.join(self.input_dir, name + '.ics'))
+        with open(os.path.join(self.input_dir, 'broken.ics'), 'w') as stream:
+            stream.write(BROKEN)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_directory_with_errors(self):
+        result = convert_batch(['ical2org2-batch', '--input-dir', self.input_dir,
+                                '--output-dir', self.output_dir, '--jobs', '2'])
+
+        self.assertEqual(result, 1)
+        for name in ('single-event', 'recurring-event'):
+            with open(os.path.join(self.output_dir, name + '.org'), encoding='utf8') as stream:
+                self.assertIn("#+PROPERTY: VERSION 2.0", stream.read())
+
+    def test_failures_are_reported_per_file(self):
+        jobs = [(os.path.join(self.input_dir, name + '.ics'), os.path.join(self.directory, name + '.org'))
+                for name in ('broken', 'single-event')]
+
+        failures = run_batch(jobs, processes=1)
+        self.assertEqual([path for path, _ in failures], [jobs[0][0]])
+        self.assertIn("DTSTART", failures[0][1])
+        self.assertTrue(os.path.exists(jobs[1][1]))
+
+    def test_from_after_to(self):
+        with redirect_stderr(io.StringIO()) as stderr, self.assertRaises(SystemExit):
+            convert_batch(['ical2org2-batch', '--input-dir', self.input_dir, '--output-dir', self.output_dir,
+                           '--from', '2019-03-01', '--to', '2019-01-01'])
+
+        self.assertIn("--from must not be after --to", stderr.getvalue())
+        self.assertFalse(os.path.exists(self.output_dir))
+
+    def test_manifest(self):
+        manifest = os.path.join(self.directory, 'manifest')
+        with open(manifest, 'w') as stream:
+            stream.write("# feeds\n\nin/a.ics\tout/a b.org\nin/b.ics out/b.org\n")
+
+        self.assertEqual(_read_manifest(manifest), [('in/a.ics', 'out/a b.org'), ('in/b.ics', 'out/b.org')])
+
+
+if __name__ == '__main__':
+    unittest.main()
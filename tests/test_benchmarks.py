@@ -0,0 +1,53 @@
+# MIT License
+
+# Copyright (c) 2019 Björn Larsson
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import io
+import unittest
+
+from benchmarks.bench import run_benchmarks
+from benchmarks.calendars import generate_calendar
+from ical2org.ical2org import Calendar
+
+
+class TestGenerator(unittest.TestCase):
+    def test_seeded(self):
+        self.assertEqual(generate_calendar(50, seed=4), generate_calendar(50, seed=4))
+        self.assertNotEqual(generate_calendar(50, seed=4), generate_calendar(50, seed=5))
+
+    def test_converts(self):
+        text = generate_calendar(200, seed=1, recurring=0.8, exdates=1.0, overrides=1.0, attachments=0.2)
+        calendar = Calendar(io.StringIO(text))
+
+        self.assertGreater(len(calendar._events), 200)
+        self.assertIn("(not (diary-date", str(calendar))
+
+    def test_run_benchmarks(self):
+        results = run_benchmarks(20, repeat=1, workloads=['mixed'])
+        stages = results['workloads']['mixed']['stages']
+
+        self.assertEqual(sorted(stages), ['get_events', 'group', 'init', 'str', 'stream'])
+        self.assertTrue(all(stage['peak_bytes'] > 0 for stage in stages.values()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+# MIT License
+
+# Copyright (c) 2019 Björn Larsson
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import io
+import os
+import re
+import shutil
+import tempfile
+import unittest
+
+from ical2org.cache import FragmentCache
+from ical2org.ical2org import StreamingCalendar
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+
+
+def _read(name):
+    with open(os.path.join(DATA_DIR, name), encoding='utf8') as stream:
+        return stream.read()
+
+
+class TestFragmentCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'cache.json')
+        self.content = _read('recurring-event.input')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _convert(self, content):
+        cache = FragmentCache(self.path)
+        events = StreamingCalendar(io.StringIO(content), cache=cache)._get_events()
+        cache.save()
+        return cache, events
+
+    def test_unchanged_calendar_is_served_from_cache(self):
+        first, expected = self._convert(self.content)
+        second, events = self._convert(self.content)
+
+        self.assertEqual((first.hits, first.misses), (0, 5))
+        self.assertEqual((second.hits, second.misses), (5, 0))
+        self.assertEqual(events, expected)
+
+    def test_changed_series_is_rendered_again(self):
+        self._convert(self.content)
+        cache, events = self._convert(self.content.replace("SUMMARY:Standup (moved)", "SUMMARY:Standup (late)"))
+
+        self.assertEqual((cache.hits, cache.misses), (3, 2))
+        self.assertIn("Standup (late)", events)
+
+    def test_volatile_properties_are_ignored(self):
+        self._convert(self.content)
+        cache, _ = self._convert(re.sub(r"DTSTAMP:\w+", "DTSTAMP:20300101T000000Z", self.content))
+
+        self.assertEqual((cache.hits, cache.misses), (5, 0))
+
+    def test_removed_series_is_pruned(self):
+        self._convert(self.content)
+        self._convert(self.content.replace("UID:9m8n7b6v5c4x3z2l1k0j9h8g7f", "UID:renamed"))
+
+        self.assertNotIn("9m8n7b6v5c4x3z2l1k0j9h8g7f", FragmentCache(self.path)._series)
+
+    def test_incomplete_conversion_is_discarded(self):
+        cache = FragmentCache()
+        cache.put("a", "old", 0, "* old")
+        cache.put("a", "new", 0, "* new")
+        self.assertEqual(cache._fresh["a"], dict(key="new", fragments=["* new"]))
+
+        cache.discard()
+        cache.save()
+        self.assertIsNone(cache.get("a", "new", 0))
+
+    def test_corrupt_cache_is_ignored(self):
+        with open(self.path, 'w') as stream:
+            stream.write("{not json")
+
+        cache, _ = self._convert(self.content)
+        self.assertEqual(cache.hits, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+# MIT License
+
+# Copyright (c) 2019 Björn Larsson
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import os
+import shutil
+import socketserver
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from ical2org.batch import run_batch
+from ical2org.fetch import FeedCache, Fetcher, _utf8, fetch_all
+from ical2org.ical2org import convert, set_timezone
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(self.path)
+        server.clients.add(self.client_address)
+
+        if self.path == '/slow.ics':
+            time.sleep(0.5)
+        if self.path not in ('/calendar.ics', '/other.ics', '/slow.ics'):
+            self._respond(404, b"")
+        elif self.headers.get('If-None-Match') == server.etag:
+            self._respond(304, None)
+        else:
+            self._respond(200, server.body, (('ETag', server.etag), ('Content-Type', 'text/calendar; charset=utf-8')))
+
+    def _respond(self, status, body, headers=()):
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        if body is not None:
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass  # Clients giving up on /slow.ics
+
+
+class TestFetch(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        with open(os.path.join(DATA_DIR, 'recurring-event.input'), 'rb') as stream:
+            body = stream.read()
+
+        self.server = _Server(('127.0.0.1', 0), _Handler)
+        self.server.body = body
+        self.server.etag = '"1"'
+        self.server.requests = list()
+        self.server.clients = set()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = "http://127.0.0.1:{}".format(self.server.server_address[1])
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.directory)
+        set_timezone()
+
+    def test_conditional_request(self):
+        fetcher = Fetcher(timeout=5)
+        try:
+            feed = fetcher.fetch(self.url + '/calendar.ics')
+            self.assertEqual((feed.status, feed.etag), (200, '"1"'))
+            self.assertIn(b"BEGIN:VCALENDAR", feed.body)
+
+            self.assertEqual(fetcher.fetch(self.url + '/calendar.ics', {'If-None-Match': '"1"'}).status, 304)
+            self.assertRaises(IOError, fetcher.fetch, self.url + '/missing.ics')
+        finally:
+            fetcher.close()
+
+        self.assertEqual(len(self.server.clients), 1)
+
+    def test_charset(self):
+        self.assertEqual(_utf8("é".encode('utf8'), None), "é".encode('utf8'))
+        self.assertEqual(_utf8("é".encode('latin-1'), 'iso-8859-1'), "é".encode('utf8'))
+        self.assertEqual(_utf8("é".encode('utf8'), 'bogus'), "é".encode('utf8'))
+
+    def test_fetch_all(self):
+        fetcher = Fetcher(timeout=0.2)
+        try:
+            results = fetch_all([(self.url + '/calendar.ics', None), (self.url + '/slow.ics', None),
+                                 (self.url + '/other.ics', None)], fetcher, jobs=2)
+        finally:
+            fetcher.close()
+
+        self.assertEqual([getattr(result, 'status', None) for result in results], [200, None, 200])
+        self.assertIsInstance(results[1], OSError)
+
+    def test_unchanged_feed_is_not_converted(self):
+        output = os.path.join(self.directory, 'calendar.org')
+        cache = os.path.join(self.directory, 'feeds.json')
+        args = ['ical2org', '--input', self.url + '/calendar.ics', '--output', output, '--feed-cache', cache,
+                '--timezone', 'UTC']
+
+        convert(args)
+        inode = os.stat(output).st_ino
+        convert(args)
+        self.assertEqual(os.stat(output).st_ino, inode)
+
+        convert(args[:-1] + ['Europe/Paris'])
+        self.assertNotEqual(os.stat(output).st_ino, inode)
+        self.assertEqual(self.server.requests, ['/calendar.ics'] * 3)
+        self.assertEqual(FeedCache(cache).validators(self.url + '/calendar.ics', output), dict())
+
+    def test_batch(self):
+        jobs = [(self.url + path, os.path.join(self.directory, name))
+                for path, name in (('/calendar.ics', 'a.org'), ('/other.ics', 'b.org'), ('/missing.ics', 'c.org'))]
+        cache = os.path.join(self.directory, 'feeds.json')
+
+        failures = run_batch(jobs, processes=1, feed_cache=cache)
+        self.assertEqual([url for url, _ in failures], [jobs[2][0]])
+        self.assertTrue(os.path.exists(jobs[1][1]))
+
+        os.remove(jobs[1][1])
+        inode = os.stat(jobs[0][1]).st_ino
+        self.assertEqual(run_batch(jobs[:2], processes=1, feed_cache=cache), [])
+        self.assertEqual(os.stat(jobs[0][1]).st_ino, inode)
+        self.assertTrue(os.path.exists(jobs[1][1]))
+
+
+if __name__ == '__main__':
+    unittest.main()
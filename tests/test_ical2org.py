@@ -20,12 +20,351 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import io
+import os
 import unittest
+from datetime import date, datetime, timedelta
+
+from dateutil import tz
+from icalendar import Calendar as iCal
+from icalendar.prop import vRecur
+
+try:
+    import pytz
+except ImportError:
+    pytz = None
+
+from ical2org.ical2org import (Calendar, Event, Expansion, StreamingCalendar, Window, _buffered, _compile_rule,
+                               _date_argument, _event_text, _iter_blocks, _iter_lines, _line, _org_active,
+                               _org_exceptions, _org_time, _org_timestamp, _run_convert, _window, set_timezone)
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+
+
+def _data(name):
+    return open(os.path.join(DATA_DIR, name), encoding='utf8')
+
+
+def _strip_created(org):
+    return "\n".join(line for line in org.split("\n") if not line.startswith("#+PROPERTY: CREATED"))
+
+
+class _PipeStream(io.StringIO):
+    def seekable(self):
+        return False
 
 
 class TestArguments(unittest.TestCase):
     pass
 
 
+class TestEvent(unittest.TestCase):
+    def _event(self, *lines):
+        return Event.from_component(iCal.from_ical("\r\n".join(("BEGIN:VEVENT", "UID:1") + lines + ("END:VEVENT",))))
+
+    def test_record(self):
+        event = self._event("DTSTART;VALUE=DATE:20190301", "RRULE:FREQ=DAILY",
+                            "EXDATE;VALUE=DATE:20190302,20190303", "EXDATE;VALUE=DATE:20190305")
+
+        self.assertFalse(hasattr(event, '__dict__'))
+        self.assertTrue(event.is_all_day())
+        self.assertTrue(event.is_recurring())
+        self.assertEqual(event.end, date(2019, 3, 2))
+        self.assertEqual(event.exdates, (date(2019, 3, 2), date(2019, 3, 3), date(2019, 3, 5)))
+        self.assertIsNone(event.recurrence_id)
+        self.assertIsNone(event.location)
+
+    def test_duration(self):
+        event = self._event("DTSTART:20190301T100000Z", "DURATION:PT30M", "SUMMARY:Call")
+
+        self.assertFalse(event.is_recurring())
+        self.assertEqual(event.end - event.start, timedelta(minutes=30))
+        self.assertIn("* Call\n", event.to_org(()))
+
+
+class TestRuleCompiler(unittest.TestCase):
+    def test_identical_rules_are_shared(self):
+        first = _compile_rule(vRecur.from_ical("FREQ=WEEKLY;BYDAY=MO,TU,WE,TH,FR"))
+        second = _compile_rule(vRecur.from_ical("BYDAY=MO,TU,WE,TH,FR;FREQ=WEEKLY"))
+        other = _compile_rule(vRecur.from_ical("FREQ=WEEKLY;BYDAY=MO"))
+
+        self.assertIs(first, second)
+        self.assertIsNot(first, other)
+
+    def test_start_dependent_parts(self):
+        rule = _compile_rule(vRecur.from_ical("FREQ=YEARLY;INTERVAL=2;COUNT=3;BYMONTH=3"))
+
+        self.assertEqual(rule.interval(date(2019, 3, 20)), "(eq 0 (% (- (nth 2 date) 2019) 2))")
+        self.assertEqual(rule.interval(date(2020, 3, 20)), "(eq 0 (% (- (nth 2 date) 2020) 2))")
+        self.assertEqual(rule.range(date(2019, 3, 20)), "(diary-block 03 20 2019 03 20 2025)")
+        self.assertIn("(memq (nth 0 date) '(3))", rule.template.template)
+
+    def test_unbounded(self):
+        rule = _compile_rule(vRecur.from_ical("FREQ=DAILY"))
+
+        self.assertIsNone(rule.end(date(2019, 1, 1)))
+        self.assertEqual(rule.range(date(2019, 1, 1)), "")
+        self.assertEqual(rule.interval(date(2019, 1, 1)), "")
+
+
+class TestTimezone(unittest.TestCase):
+    def tearDown(self):
+        set_timezone()
+
+    def test_target_timezone(self):
+        start = datetime(2019, 2, 12, 18, 0, tzinfo=tz.tzutc())
+        end = datetime(2019, 2, 12, 19, 0, tzinfo=tz.tzutc())
+
+        set_timezone('Europe/Paris')
+        self.assertEqual(_org_time(start, end), "19:00--20:00 ")
+        self.assertEqual(_org_timestamp(start), "[2019-02-12 {} 19:00]".format(date(2019, 2, 12).strftime("%a")))
+
+        set_timezone('America/New_York')
+        self.assertEqual(_org_time(start, end), "13:00--14:00 ")
+
+    def test_all_day_timestamp(self):
+        set_timezone('Asia/Tokyo')
+        self.assertTrue(_org_timestamp(date(2019, 3, 1)).startswith("[2019-03-01 "))
+        self.assertTrue(_org_timestamp(date(2019, 3, 1)).endswith(" 00:00]"))
+
+    def test_unknown_timezone(self):
+        self.assertRaises(ValueError, set_timezone, 'Nowhere/Special')
+
+    def test_convert(self):
+        with _data('single-event.input') as stream:
+            out = io.StringIO()
+            _run_convert(stream, out, timezone='Europe/Paris')
+
+        self.assertIn("19:00--20:00 Some description", out.getvalue())
+
+
+class TestRendering(unittest.TestCase):
+    def test_iter_org_matches_str(self):
+        with _data('recurring-event.input') as stream:
+            calendar = Calendar(stream)
+
+        chunks = list(calendar.iter_org())
+        self.assertTrue(chunks[0].startswith("# -*- buffer-read-only: t -*-"))
+        self.assertEqual(_strip_created("".join(chunks)), _strip_created(str(calendar)))
+
+    def test_buffered(self):
+        self.assertEqual(list(_buffered(["ab", "c", "def", "g"], size=3)), ["abc", "def", "g"])
+        self.assertEqual(list(_buffered([])), [])
+
+
+class TestSeries(unittest.TestCase):
+    def _summaries(self, sort):
+        with _data('recurring-event.input') as stream:
+            org = str(Calendar(stream, sort=sort))
+        return [line[2:] for line in org.split("\n") if line.startswith("* ")]
+
+    def test_input_order(self):
+        self.assertEqual(self._summaries('input'), ["All day conference", "Standup", "Standup (moved)",
+                                                    "Bimonthly review with a very long summary that is folded "
+                                                    "over more than one line", "Birthday"])
+
+    def test_start_order(self):
+        self.assertEqual(self._summaries('start')[:3], ["Bimonthly review with a very long summary that is "
+                                                        "folded over more than one line", "Standup",
+                                                        "Standup (moved)"])
+
+    def test_index(self):
+        with _data('recurring-event.input') as stream:
+            calendar = Calendar(stream)
+
+        series = calendar._series['3jqcl6n5ds4rq0p4mto2fp7kgl']
+        self.assertEqual([e.summary for e in series.events], ["Standup"])
+        self.assertEqual([e.summary for e in series.overrides], ["Standup (moved)"])
+
+    def test_excluded_dates_are_deduplicated(self):
+        self.assertEqual(_org_exceptions([date(2019, 2, 6), datetime(2019, 2, 12, 9)], [date(2019, 2, 12)]),
+                         "(not (diary-date 2 6 2019)) (not (diary-date 2 12 2019))")
+
+
+class TestWindow(unittest.TestCase):
+    def setUp(self):
+        set_timezone('UTC')
+
+    def tearDown(self):
+        set_timezone()
+
+    def _summaries(self, window, stream=False):
+        with _data('recurring-event.input') as data:
+            calendar = StreamingCalendar(data, window=window) if stream else Calendar(data, window=window)
+            org = calendar._get_events()
+        return [line[2:12] for line in org.split("\n") if line.startswith("* ")], calendar.statistics()['pruned']
+
+    def test_all_day_end_is_exclusive(self):
+        event = Event("1", "", date(2019, 3, 1), date(2019, 3, 3))
+
+        self.assertTrue(Window(date(2019, 3, 2)).contains(event))
+        self.assertFalse(Window(date(2019, 3, 3)).contains(event))
+        self.assertFalse(Window(None, date(2019, 2, 28)).contains(event))
+
+    def test_recurrence_end(self):
+        rule = vRecur.from_ical("FREQ=MONTHLY;INTERVAL=2;COUNT=6;BYDAY=3TU")
+        event = Event("1", "", datetime(2019, 1, 15, 13, tzinfo=tz.tzutc()),
+                      datetime(2019, 1, 15, 14, tzinfo=tz.tzutc()), rule=rule)
+
+        self.assertTrue(Window(date(2020, 1, 15)).contains(event))
+        self.assertFalse(Window(date(2020, 1, 16)).contains(event))
+        self.assertTrue(Window(date(2030, 1, 1)).contains(Event("2", "", date(2019, 3, 20), date(2019, 3, 21),
+                                                                vRecur.from_ical("FREQ=YEARLY"))))
+
+    def test_relative_dates(self):
+        start = _date_argument("-30")
+        self.assertEqual(start, timedelta(days=-30))
+        window = _window(start, _date_argument("2030-12-31"))
+        self.assertEqual((window.start, window.end), (date.today() - timedelta(days=30), date(2030, 12, 31)))
+
+    def test_calendar(self):
+        for stream in (False, True):
+            summaries, pruned = self._summaries(Window(date(2019, 3, 2), date(2019, 12, 31)), stream)
+            self.assertEqual(summaries, ["All day co", "Standup", "Bimonthly ", "Birthday"])
+            self.assertEqual(pruned, 1)
+
+            summaries, pruned = self._summaries(Window(None, date(2019, 1, 31)), stream)
+            self.assertEqual(summaries, ["Bimonthly "])
+            self.assertEqual(pruned, 4)
+
+
+class TestExpansion(unittest.TestCase):
+    def setUp(self):
+        set_timezone('Europe/Paris')
+
+    def tearDown(self):
+        set_timezone()
+
+    def _event(self, rule, exdates=(), start=datetime(2019, 2, 4, 9, 30), end=datetime(2019, 2, 4, 9, 45)):
+        paris = tz.gettz('Europe/Paris')
+        return Event("1", "Standup", start.replace(tzinfo=paris), end.replace(tzinfo=paris), vRecur.from_ical(rule),
+                     exdates=tuple(d.replace(tzinfo=paris) for d in exdates))
+
+    def test_active_timestamps(self):
+        self.assertEqual(_org_active(date(2019, 3, 1), date(2019, 3, 2)), "<2019-03-01 Fri>")
+        self.assertEqual(_org_active(date(2019, 3, 1), date(2019, 3, 3)), "<2019-03-01 Fri>--<2019-03-02 Sat>")
+
+        start = datetime(2019, 3, 1, 22, tzinfo=tz.tzutc())
+        self.assertEqual(_org_active(start, start + timedelta(minutes=30)), "<2019-03-01 Fri 23:00-23:30>")
+        self.assertEqual(_org_active(start, start + timedelta(hours=2)),
+                         "<2019-03-01 Fri 23:00>--<2019-03-02 Sat 01:00>")
+
+    def test_exceptions(self):
+        event = self._event("FREQ=WEEKLY;BYDAY=MO,TU,WE,TH,FR;UNTIL=20190211T083000Z",
+                            exdates=[datetime(2019, 2, 6, 9, 30)])
+
+        self.assertEqual(Expansion(date(2019, 12, 31)).timestamps(event, [datetime(2019, 2, 7, 8, 30,
+                                                                                   tzinfo=tz.tzutc())]),
+                         "<2019-02-04 Mon 09:30-09:45>\n<2019-02-05 Tue 09:30-09:45>\n"
+                         "<2019-02-08 Fri 09:30-09:45>\n<2019-02-11 Mon 09:30-09:45>")
+
+    def test_window_start(self):
+        event = self._event("FREQ=DAILY;COUNT=10")
+        self.assertEqual(Expansion(date(2019, 12, 31), start=date(2019, 2, 12)).timestamps(event, ()),
+                         "<2019-02-12 Tue 09:30-09:45>\n<2019-02-13 Wed 09:30-09:45>")
+
+    def test_daylight_saving_change(self):
+        zones = [tz.gettz('Europe/Paris')] + ([pytz.timezone('Europe/Paris')] if pytz is not None else [])
+        for paris in zones:
+            localize = getattr(paris, 'localize', lambda dt: dt.replace(tzinfo=paris))
+            event = Event("1", "Standup", localize(datetime(2019, 3, 25, 9, 30)), localize(datetime(2019, 3, 25, 10)),
+                          vRecur.from_ical("FREQ=WEEKLY;BYDAY=MO;COUNT=2"))
+
+            self.assertEqual(Expansion(date(2019, 12, 31)).timestamps(event, ()),
+                             "<2019-03-25 Mon 09:30-10:00>\n<2019-04-01 Mon 09:30-10:00>")
+
+    def test_kept_as_sexp(self):
+        expansion = Expansion(date(2019, 12, 31), limit=10)
+
+        self.assertIsNone(expansion.timestamps(self._event("FREQ=DAILY"), ()))
+        self.assertIsNone(expansion.timestamps(self._event("FREQ=DAILY;COUNT=11"), ()))
+        self.assertIsNone(expansion.timestamps(self._event("FREQ=MONTHLY;UNTIL=20200101"), ()))
+        self.assertIsNotNone(expansion.timestamps(self._event("FREQ=DAILY;COUNT=10"), ()))
+
+    def test_calendar(self):
+        expansion = Expansion(date(2020, 12, 31))
+        with _data('recurring-event.input') as data:
+            expected = Calendar(data, expansion=expansion)._get_events()
+        with _data('recurring-event.input') as data:
+            org = StreamingCalendar(data, expansion=expansion)._get_events()
+
+        self.assertEqual(org, expected)
+        self.assertIn("* All day conference\n<2019-03-01 Fri>--<2019-03-02 Sat>\n", org)
+        self.assertIn("* Standup (moved)\n<2019-02-12 Tue 10:00-10:15>\n", org)
+        self.assertIn("<2019-01-15 Tue 14:00-15:00>\n<2019-03-19 Tue 14:00-15:00>\n", org)
+        self.assertIn("(not (diary-date 2 12 2019))) 09:30--09:45 Standup", org)
+
+
+class TestStreaming(unittest.TestCase):
+    def test_unfold(self):
+        buffer = "\ufeffSUMMARY:A long\r\n  summary\r\n\tcontinued\r\n\r\nuid:1\nDESCRIPTION:é".encode('utf8')
+        self.assertEqual([(name, _line(buffer, start, end)) for name, start, end in _iter_lines(buffer)],
+                         [(b"SUMMARY", "SUMMARY:A long summarycontinued"), (b"UID", "uid:1"),
+                          (b"DESCRIPTION", "DESCRIPTION:é")])
+
+    def test_blocks(self):
+        buffer = ("BEGIN:VCALENDAR\r\nVERSION:2.0\r\nBEGIN:VTODO\r\nUID:1\r\nEND:VTODO\r\n"
+                  "BEGIN:VEVENT\r\nUID:2\r\nATTACH:QUJD\r\n QUJD\r\nBEGIN:VALARM\r\nUID:3\r\nEND:VALARM\r\n"
+                  "END:VEVENT\r\nEND:VCALENDAR\r\n").encode('utf8')
+
+        blocks = [(name, lines) for name, lines, _, _ in _iter_blocks(buffer, {'VEVENT': ('UID',)})]
+        self.assertEqual(blocks, [(None, ["VERSION:2.0"]), ('VEVENT', ["BEGIN:VEVENT", "UID:2", "END:VEVENT"])])
+
+        blocks = [(name, lines) for name, lines, _, _ in _iter_blocks(buffer, {'VEVENT': None})]
+        self.assertEqual(blocks[1][1][2:5], ["ATTACH:QUJDQUJD", "BEGIN:VALARM", "UID:3"])
+
+    def test_binary_input(self):
+        with _data('recurring-event.input') as stream:
+            expected = Calendar(stream)._get_events()
+
+        with open(os.path.join(DATA_DIR, 'recurring-event.input'), 'rb') as stream:
+            content = stream.read()
+        self.assertEqual(Calendar(io.BytesIO(content))._get_events(), expected)
+        self.assertEqual(StreamingCalendar(io.BufferedReader(io.BytesIO(content)))._get_events(), expected)
+        self.assertEqual(StreamingCalendar(content)._get_events(), expected)  # As read by watch and batch
+
+    def test_matches_calendar(self):
+        with _data('recurring-event.input') as stream:
+            expected = str(Calendar(stream))
+
+        with _data('recurring-event.input') as stream:
+            out = io.StringIO()
+            _run_convert(stream, out, stream=True)
+
+        self.assertEqual(_strip_created(out.getvalue()), _strip_created(expected))
+
+    def test_unused_properties_are_skipped(self):
+        lines = ["BEGIN:VEVENT", "UID:1", "DTSTART:20190301T100000Z",
+                 "ATTACH;ENCODING=BASE64;VALUE=BINARY:" + "QUJD" * 1000, "X-ALT-DESC;FMTTYPE=text/html:<p>x</p>",
+                 "ATTENDEE;CN=A:mailto:a@example.com", "SUMMARY:Review",
+                 "BEGIN:VALARM", "DESCRIPTION:Reminder", "END:VALARM", "END:VEVENT"]
+
+        self.assertEqual(_event_text(lines), "BEGIN:VEVENT\r\nUID:1\r\nDTSTART:20190301T100000Z\r\n"
+                                             "SUMMARY:Review\r\nEND:VEVENT")
+
+    def test_timezone_defined_after_events(self):
+        content = ("BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:test\r\n"
+                   "BEGIN:VEVENT\r\nUID:1\r\nSUMMARY:Late zone\r\nDTSTART;TZID=Test/Late:20190301T100000\r\n"
+                   "DTEND;TZID=Test/Late:20190301T110000\r\nEND:VEVENT\r\n"
+                   "BEGIN:VTIMEZONE\r\nTZID:Test/Late\r\nBEGIN:STANDARD\r\nDTSTART:19700101T000000\r\n"
+                   "TZOFFSETFROM:+0500\r\nTZOFFSETTO:+0500\r\nEND:STANDARD\r\nEND:VTIMEZONE\r\n"
+                   "END:VCALENDAR\r\n")
+        set_timezone('UTC')
+        try:
+            streamed = StreamingCalendar(io.StringIO(content))._get_events()
+            self.assertIn("05:00--06:00", streamed)
+            self.assertEqual(streamed, Calendar(io.StringIO(content))._get_events())
+        finally:
+            set_timezone()
+
+    def test_non_seekable_input(self):
+        with _data('recurring-event.input') as stream:
+            content = stream.read()
+
+        calendar = StreamingCalendar(_PipeStream(content))
+        self.assertEqual(repr(calendar), "Calendar (5 Events)")
+        self.assertIn("(not (diary-date 2 12 2019))", calendar._get_events())
+
+
 if __name__ == '__main__':
     unittest.main()
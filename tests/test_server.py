@@ -0,0 +1,124 @@
+# MIT License
+
+# Copyright (c) 2019 Björn Larsson
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import os
+import shutil
+import tempfile
+import threading
+import tracemalloc
+import unittest
+from datetime import date
+
+from ical2org.ical2org import Calendar
+from ical2org.server import Client, ConversionCache, ConversionServer, ConversionService, convert_remote
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+INPUT = os.path.join(DATA_DIR, 'recurring-event.input')
+
+
+def _events(org):
+    return org.split("\n\n", 1)[1]
+
+
+class TestConversionCache(unittest.TestCase):
+    def test_least_recently_used_are_evicted(self):
+        cache = ConversionCache(max_bytes=10)
+        cache.put('a', 1, 4)
+        cache.put('b', 2, 4)
+        self.assertEqual(cache.get('a'), 1)
+        cache.put('c', 3, 4)
+
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual((cache.get('a'), cache.get('c')), (1, 3))
+        self.assertEqual((cache.size, len(cache)), (8, 2))
+
+        cache.put('d', 4, 11)
+        self.assertIsNone(cache.get('d'))
+
+
+class TestService(unittest.TestCase):
+    def setUp(self):
+        with open(INPUT, 'rb') as stream:
+            self.data = stream.read()
+
+    def test_cached_conversions(self):
+        service = ConversionService()
+
+        output, cached = service.convert(self.data, dict(timezone='UTC'))
+        self.assertIsNone(cached)
+        self.assertEqual(service.convert(self.data, dict(timezone='UTC')), (output, 'output'))
+
+        paris, cached = service.convert(self.data, dict(timezone='Europe/Paris', sort='start'))
+        self.assertEqual(cached, 'calendar')
+        self.assertNotEqual(_events(paris), _events(output))
+
+        pruned, _ = service.convert(self.data, {'timezone': 'UTC', 'from': '2019-03-02'})
+        self.assertNotIn("* Standup (moved)", pruned)
+        self.assertRaises(ValueError, service.convert, self.data, dict(sort='size'))
+
+    def test_calendar_size(self):
+        Calendar(self.data)  # Imports and caches that are not part of the calendar
+        tracemalloc.start()
+        try:
+            calendar = Calendar(self.data)
+            allocated, _ = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        self.assertGreater(allocated, 2 * len(self.data))
+        self.assertLess(abs(calendar.memory_estimate() - allocated), allocated / 2)
+
+
+class TestServer(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.socket = os.path.join(self.directory, 'ical2org.sock')
+        self.server = ConversionServer(self.socket)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.directory)
+
+    def test_client(self):
+        with open(INPUT, 'rb') as stream:
+            data = stream.read()
+
+        with Client(self.socket, timeout=10) as client:
+            output = client.convert(data, timezone='UTC')
+            self.assertEqual(_events(client.convert(path=INPUT, timezone='UTC')), _events(output))
+            self.assertIn("* Standup (moved)", output)
+            self.assertNotIn("* Standup (moved)", client.convert(data, timezone='UTC', from_date=date(2019, 3, 2)))
+            self.assertRaises(ValueError, client.convert, b"BEGIN:VCALENDAR\r\nBEGIN:VEVENT\r\nUID:1\r\n"
+                                                          b"END:VEVENT\r\nEND:VCALENDAR\r\n")
+            self.assertIn("* Birthday", client.convert(data.decode('utf8')))
+
+        # The output for the path, the parsed calendar for the other options
+        self.assertEqual(self.server.service.cache.hits, 3)
+        self.assertEqual(_events(convert_remote(self.socket, data, timezone='UTC')), _events(output))
+        self.assertEqual(os.stat(self.socket).st_mode & 0o777, 0o600)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+# MIT License
+
+# Copyright (c) 2019 Björn Larsson
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from ical2org.ical2org import Calendar, StreamingCalendar, convert, set_timezone
+from ical2org.shards import MANIFEST, run_shards, write_shards
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+INPUT = os.path.join(DATA_DIR, 'recurring-event.input')
+
+
+class TestShards(unittest.TestCase):
+    def setUp(self):
+        set_timezone('UTC')
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        set_timezone()
+        shutil.rmtree(self.directory)
+
+    def _manifest(self):
+        with open(os.path.join(self.directory, MANIFEST), encoding='utf8') as stream:
+            return [os.path.basename(line.strip()) for line in stream]
+
+    def _read(self, name):
+        with open(os.path.join(self.directory, name), encoding='utf8') as stream:
+            return stream.read()
+
+    def test_by_month(self):
+        with open(INPUT, encoding='utf8') as stream:
+            written = write_shards(Calendar(stream), self.directory, 'month')
+
+        self.assertEqual(self._manifest(), ["2019-01.org", "2019-02.org", "2019-03.org"])
+        self.assertEqual(len(written), 3)
+        self.assertIn("* Standup (moved)", self._read("2019-02.org"))
+        self.assertIn("* Birthday", self._read("2019-03.org"))
+        self.assertTrue(self._read("2019-01.org").startswith("# -*- buffer-read-only: t -*-"))
+
+    def test_streaming_matches(self):
+        for stream_input in (False, True):
+            with open(INPUT, encoding='utf8') as stream:
+                calendar = StreamingCalendar(stream) if stream_input else Calendar(stream)
+                write_shards(calendar, self.directory, 'kind')
+
+            self.assertEqual(self._manifest(), ["recurring.org", "single.org"])
+            self.assertNotIn("* Standup (moved)", self._read("recurring.org"))
+            self.assertIn("* All day conference", self._read("single.org"))
+
+    def test_unchanged_shards_are_kept(self):
+        with open(INPUT, encoding='utf8') as stream:
+            run_shards(stream, self.directory, 'month')
+        inode = os.stat(os.path.join(self.directory, "2019-02.org")).st_ino
+
+        with open(INPUT, encoding='utf8') as stream:
+            self.assertEqual(run_shards(stream, self.directory, 'month', stream=True), [])
+        self.assertEqual(os.stat(os.path.join(self.directory, "2019-02.org")).st_ino, inode)
+
+    def test_stale_shards_are_removed(self):
+        with open(INPUT, encoding='utf8') as stream:
+            run_shards(stream, self.directory, 'month')
+        convert(['ical2org', '--input', INPUT, '--output', self.directory, '--shard', 'calendar'])
+
+        self.assertEqual(self._manifest(), ["Tester.org"])
+        self.assertEqual(sorted(os.listdir(self.directory)), ["Tester.org", MANIFEST])
+
+    def test_foreign_files_are_kept(self):
+        todo = os.path.join(self.directory, "todo.org")
+        with open(todo, 'w', encoding='utf8') as stream:
+            stream.write("* TODO Keep me\n")
+        with open(os.path.join(self.directory, MANIFEST), 'w', encoding='utf8') as stream:
+            stream.write(todo + "\n")
+
+        with open(INPUT, encoding='utf8') as stream:
+            with self.assertRaises(ValueError):
+                run_shards(stream, self.directory, 'kind')
+        self.assertEqual(self._manifest(), ["todo.org"])
+        self.assertEqual(sorted(os.listdir(self.directory)), [MANIFEST, "todo.org"])
+
+        os.remove(os.path.join(self.directory, MANIFEST))
+        with open(INPUT, encoding='utf8') as stream:
+            run_shards(stream, self.directory, 'kind')
+        with open(os.path.join(self.directory, MANIFEST), 'a', encoding='utf8') as stream:
+            stream.write(todo + "\n")
+        self.assertEqual(convert(['ical2org', '--input', INPUT, '--output', self.directory, '--shard', 'month']), 1)
+        self.assertEqual(sorted(os.listdir(self.directory)), [MANIFEST, "recurring.org", "single.org", "todo.org"])
+        self.assertEqual(self._read("todo.org"), "* TODO Keep me\n")
+
+    def test_foreign_file_with_shard_name_is_kept(self):
+        with open(os.path.join(self.directory, "2019-02.org"), 'w', encoding='utf8') as stream:
+            stream.write("* Notes\n")
+
+        with open(INPUT, encoding='utf8') as stream:
+            with self.assertRaises(ValueError):
+                run_shards(stream, self.directory, 'month')
+        self.assertEqual(os.listdir(self.directory), ["2019-02.org"])
+        self.assertEqual(self._read("2019-02.org"), "* Notes\n")
+
+
+if __name__ == '__main__':
+    unittest.main()
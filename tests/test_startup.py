@@ -0,0 +1,52 @@
+# MIT License
+
+# Copyright (c) 2019 Björn Larsson
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import os
+import unittest
+
+from benchmarks.startup import IMPORTTIME, SCENARIOS, measure
+
+# Slow or heavily loaded machines can scale the budgets, e.g. ICAL2ORG_STARTUP_SCALE=3
+SCALE = float(os.environ.get('ICAL2ORG_STARTUP_SCALE', '1'))
+
+
+class TestStartup(unittest.TestCase):
+    def test_version_does_not_import_dependencies(self):
+        _, _, modules = measure(SCENARIOS['version']['args'])
+
+        self.assertIn('ical2org.ical2org', modules)
+        # tempfile imports random, which imports hashlib before Python 3.8
+        for module in ('icalendar', 'dateutil', 'dateutil.tz', 'dateutil.relativedelta', 'cProfile', 'ctypes',
+                       'tempfile', 'random', 'hashlib'):
+            self.assertNotIn(module, modules)
+
+    @unittest.skipUnless(IMPORTTIME, "-X importtime needs Python 3.7")
+    def test_budgets(self):
+        for name, scenario in sorted(SCENARIOS.items()):
+            imports, _, _ = measure(scenario['args'])
+            self.assertLessEqual(imports, scenario['budget'] * SCALE,
+                                 "{} start up imports took {:.1f} ms".format(name, imports))
+
+
+if __name__ == '__main__':
+    unittest.main()
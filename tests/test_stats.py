@@ -0,0 +1,113 @@
+# MIT License
+
+# Copyright (c) 2019 Björn Larsson
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from ical2org.ical2org import _run_convert, convert
+from ical2org.stats import Stats
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+
+
+class TestStats(unittest.TestCase):
+    def test_timed(self):
+        stats = Stats()
+        self.assertEqual(list(stats.timed('render', iter("abc"))), ["a", "b", "c"])
+        self.assertEqual(list(stats.stages), ['render'])
+
+    def test_nested_stages_are_excluded(self):
+        stats = Stats()
+        with stats.total():
+            with stats.stage('render'):
+                with stats.stage('parse'):
+                    sum(range(100000))
+
+        total = stats.stages.pop('total')
+        self.assertEqual(list(stats.stages), ['parse', 'render'])
+        self.assertAlmostEqual(sum(wall for wall, _ in stats.stages.values()), total[0], places=3)
+        self.assertLess(stats.stages['render'][0], stats.stages['parse'][0])
+
+    def test_writer_counts_bytes(self):
+        stats = Stats()
+        out = io.StringIO()
+        stats.writer(out).writelines(["a", "å"])
+
+        self.assertEqual(out.getvalue(), "aå")
+        self.assertEqual(stats.counts['output_bytes'], 3)
+
+
+class TestStatsOption(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _convert(self, *options):
+        path = os.path.join(self.directory, 'stats.json')
+        convert(['ical2org2', '--input', os.path.join(DATA_DIR, 'recurring-event.input'),
+                 '--output', os.path.join(self.directory, 'out.org'), '--stats', path] + list(options))
+        with open(path) as stream:
+            return json.load(stream)
+
+    def test_counts(self):
+        for options in ([], ['--stream']):
+            counts = self._convert(*options)['counts']
+            self.assertEqual(counts['events'], 5)
+            self.assertEqual(counts['series'], 4)
+            self.assertEqual(counts['recurring'], 3)
+            self.assertEqual(counts['exceptions'], 1)
+            self.assertEqual(counts['frequencies'], {'WEEKLY': 1, 'MONTHLY': 1, 'YEARLY': 1})
+            self.assertEqual(counts['input_bytes'], os.path.getsize(os.path.join(DATA_DIR, 'recurring-event.input')))
+            self.assertEqual(counts['output_bytes'], os.path.getsize(os.path.join(self.directory, 'out.org')))
+
+    def test_stages(self):
+        for options, expected in (([], ['group', 'parse', 'read', 'render', 'total', 'write']),
+                                  (['--sort', 'start'], ['group', 'parse', 'read', 'render', 'sort', 'total', 'write']),
+                                  (['--stream'], ['index', 'parse', 'read', 'render', 'total', 'write'])):
+            stages = self._convert(*options)['stages']
+            self.assertEqual(sorted(stages), expected)
+            self.assertTrue(all(stage['wall'] >= 0 and stage['cpu'] >= 0 for stage in stages.values()))
+
+    def test_input_bytes_of_pipes(self):
+        with open(os.path.join(DATA_DIR, 'recurring-event.input'), 'rb') as stream:
+            data = stream.read()
+
+        for stream_input in (False, True):
+            stats = Stats()
+            _run_convert(io.BytesIO(data), io.StringIO(), stream=stream_input, stats=stats)
+            self.assertEqual(stats.counts['input_bytes'], len(data))
+
+    def test_profile(self):
+        profile = os.path.join(self.directory, 'run.prof')
+        self._convert('--profile', profile)
+        self.assertGreater(os.path.getsize(profile), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+# MIT License
+
+# Copyright (c) 2019 Björn Larsson
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from ical2org.atomic import atomic_write
+from ical2org.ical2org import _run_watch
+from ical2org.watch import PollingWatcher, watcher
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+
+
+def _replace(path, content):
+    with atomic_write(path) as stream:
+        stream.write(content)
+
+
+class TestWatcher(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'calendar.ics')
+        _replace(self.path, "first")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _check(self, changes):
+        try:
+            self.assertEqual(changes.wait(timeout=0.1), [])
+            threading.Timer(0.1, _replace, (self.path, "second version")).start()
+            self.assertEqual(changes.wait(timeout=5), [self.path])
+        finally:
+            changes.close()
+
+    def test_polling(self):
+        self._check(PollingWatcher([self.path], interval=0.02))
+
+    def test_default(self):
+        self._check(watcher([self.path], interval=0.02))
+
+
+class TestAtomicWrite(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'out.org')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_failed_write_keeps_old_content(self):
+        _replace(self.path, "old")
+        os.chmod(self.path, 0o640)
+
+        with self.assertRaises(RuntimeError):
+            with atomic_write(self.path) as stream:
+                stream.write("partial")
+                raise RuntimeError()
+
+        with open(self.path) as stream:
+            self.assertEqual(stream.read(), "old")
+        self.assertEqual(os.listdir(self.directory), ['out.org'])
+
+        _replace(self.path, "new")
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o640)
+
+    def test_symlink_target_is_replaced(self):
+        os.mkdir(os.path.join(self.directory, 'real'))
+        target = os.path.join(self.directory, 'real', 'out.org')
+        _replace(target, "old")
+        os.symlink(target, self.path)
+
+        _replace(self.path, "new")
+        self.assertTrue(os.path.islink(self.path))
+        with open(target) as stream:
+            self.assertEqual(stream.read(), "new")
+        self.assertEqual(os.listdir(os.path.join(self.directory, 'real')), ['out.org'])
+
+    @unittest.skipUnless(os.path.isdir('/proc/self/fd'), "needs /proc/self/fd")
+    def test_symlink_to_pipe_is_written_directly(self):
+        read, write = os.pipe()
+        try:
+            os.symlink('/proc/self/fd/{}'.format(write), self.path)  # Like /dev/stdout on a pipe
+            with atomic_write(self.path) as stream:
+                stream.write("piped")
+            self.assertEqual(os.read(read, 100), b"piped")
+        finally:
+            os.close(read)
+            os.close(write)
+
+    def test_volatile_lines_are_ignored(self):
+        volatile = (b"#+PROPERTY: CREATED ",)
+        _replace(self.path, "#+PROPERTY: CREATED 1\n* event\n")
+        inode = os.stat(self.path).st_ino
+
+        with atomic_write(self.path, volatile=volatile) as stream:
+            stream.write("#+PROPERTY: CREATED 2\n* event\n")
+        self.assertEqual(os.stat(self.path).st_ino, inode)
+        self.assertEqual(os.listdir(self.directory), ['out.org'])
+
+        with atomic_write(self.path, volatile=volatile) as stream:
+            stream.write("#+PROPERTY: CREATED 3\n* other\n")
+        self.assertNotEqual(os.stat(self.path).st_ino, inode)
+        with open(self.path) as stream:
+            self.assertEqual(stream.read(), "#+PROPERTY: CREATED 3\n* other\n")
+
+
+class TestWatchMode(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.input = os.path.join(self.directory, 'calendar.ics')
+        self.output = os.path.join(self.directory, 'calendar.org')
+        shutil.copy(os.path.join(DATA_DIR, 'recurring-event.input'), self.input)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _read_output(self):
+        with open(self.output, encoding='utf8') as stream:
+            return stream.read()
+
+    def test_converts_on_change(self):
+        thread = threading.Thread(target=_run_watch, args=(self.input, self.output),
+                                  kwargs=dict(interval=0.02, runs=2))
+        thread.start()
+
+        deadline = time.time() + 5
+        while not os.path.exists(self.output) and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertIn("* Birthday", self._read_output())
+
+        with open(self.input, encoding='utf8') as stream:
+            content = stream.read()
+        _replace(self.input, content.replace("SUMMARY:Birthday", "SUMMARY:Anniversary"))
+
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertIn("* Anniversary", self._read_output())
+        self.assertNotIn("* Birthday", self._read_output())
+
+
+if __name__ == '__main__':
+    unittest.main()